@@ -137,6 +137,10 @@ class Base(metaclass=MetaBase):
     def get_metadata(self, i):
         return self[i].metadata()
 
+    def prefetch_metadata(self, names):
+        # Elements can override this to fetch several metadata at once
+        pass
+
     def unique_values(self, *coords, remapping=None, progress_bar=True):
         """
         Given a list of metadata attributes, such as date, param, levels,
@@ -155,8 +159,13 @@ class Base(metaclass=MetaBase):
                 desc=f"Finding coords in dataset for {coords}",
             )
 
+        keys = remapping.components(coords)
+
         dic = defaultdict(dict)
         for f in iterable:
+            prefetch = getattr(f, "prefetch_metadata", None)
+            if prefetch is not None:
+                prefetch(keys)
             metadata = remapping(f.metadata)
             for k in coords:
                 v = metadata(k)
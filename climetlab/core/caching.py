@@ -635,6 +635,29 @@ settings_changed = in_executor(CACHE._settings_changed)
 cache_directory = in_executor(CACHE._cache_directory)
 
 
+def cache_file_path(owner: str, args, hash_extra=None, extension: str = ".cache"):
+    """Returns the path that :py:func:`cache_file` would use for the same arguments,
+    without creating or registering the file.
+    """
+    m = hashlib.sha256()
+    m.update(owner.encode("utf-8"))
+
+    m.update(
+        json.dumps(args, sort_keys=True, default=default_serialiser).encode("utf-8")
+    )
+    m.update(json.dumps(hash_extra, sort_keys=True).encode("utf-8"))
+    m.update(json.dumps(extension, sort_keys=True).encode("utf-8"))
+
+    return os.path.join(
+        SETTINGS.get("cache-directory"),
+        "{}-{}{}".format(
+            owner.lower(),
+            m.hexdigest(),
+            extension,
+        ),
+    )
+
+
 def cache_file(
     owner: str,
     create,
@@ -660,28 +683,12 @@ def cache_file(
         Full path to the cache file.
     """
 
-    m = hashlib.sha256()
-    m.update(owner.encode("utf-8"))
-
-    m.update(
-        json.dumps(args, sort_keys=True, default=default_serialiser).encode("utf-8")
-    )
-    m.update(json.dumps(hash_extra, sort_keys=True).encode("utf-8"))
-    m.update(json.dumps(extension, sort_keys=True).encode("utf-8"))
-
     if replace is not None:
         # Don't replace files that are not in the cache
         if not file_in_cache_directory(replace):
             replace = None
 
-    path = os.path.join(
-        SETTINGS.get("cache-directory"),
-        "{}-{}{}".format(
-            owner.lower(),
-            m.hexdigest(),
-            extension,
-        ),
-    )
+    path = cache_file_path(owner, args, hash_extra=hash_extra, extension=extension)
 
     try:
 
@@ -721,19 +728,32 @@ def cache_file(
     return path
 
 
+def _auxiliary_cache_args(path, index):
+    stat = os.stat(path)
+    return (
+        path,
+        stat.st_ctime,
+        stat.st_mtime,
+        stat.st_size,
+        index,
+    )
+
+
 def auxiliary_cache_file(
     owner,
     path,
     index=0,
     content=None,
     extension=".cache",
+    create=None,
 ):
     # Create an auxiliary cache file
     # to be used for example to cache an index
     # It is invalidated if `path` is changed
-    stat = os.stat(path)
+    # If `create` is provided, it is called to write the file
+    # instead of simply touching it.
 
-    def create(target, args):
+    def touch(target, args):
         # Simply touch the file
         with open(target, "w") as f:
             if content:
@@ -741,14 +761,17 @@ def auxiliary_cache_file(
 
     return cache_file(
         owner,
-        create,
-        (
-            path,
-            stat.st_ctime,
-            stat.st_mtime,
-            stat.st_size,
-            index,
-        ),
+        touch if create is None else create,
+        _auxiliary_cache_args(path, index),
+        extension=extension,
+    )
+
+
+def auxiliary_cache_file_path(owner, path, index=0, extension=".cache"):
+    # Path of the auxiliary cache file for `path`, which may not exist
+    return cache_file_path(
+        owner,
+        _auxiliary_cache_args(path, index),
         extension=extension,
     )
 
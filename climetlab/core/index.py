@@ -12,17 +12,44 @@ import functools
 import logging
 import math
 from abc import abstractmethod
-from collections import defaultdict
 
 import climetlab as cml
 from climetlab.core.order import normalize_order_by
 from climetlab.core.select import normalize_selection
+from climetlab.core.table import MetadataTable, compact
 from climetlab.loaders import build_remapping
 from climetlab.sources import Source
+from climetlab.utils.offsets import CumulativeLengths
 
 LOG = logging.getLogger(__name__)
 
 
+def fields_to_numpy(fields, *args, dtype=None, out=None, **kwargs):
+    """Returns the values of `fields` as one array of shape `(len(fields), *shape)`.
+    The array is allocated once (or `out` is used) and each field is decoded
+    to `dtype` and copied directly into its slot.
+    """
+    import numpy as np
+
+    if len(fields) == 0:
+        return np.array([], dtype=dtype) if out is None else out
+
+    if dtype is not None:
+        kwargs["dtype"] = dtype
+
+    for i, f in enumerate(fields):
+        values = f.to_numpy(*args, **kwargs)
+        if i == 0:
+            shape = (len(fields),) + values.shape
+            if out is None:
+                out = np.empty(shape, dtype=values.dtype if dtype is None else dtype)
+            elif out.shape != shape:
+                raise ValueError(f"Invalid output shape {out.shape}, expected {shape}")
+        out[i] = values
+
+    return out
+
+
 class OrderOrSelection:
     def __str__(self):
         return f"{self.__class__.__name__}({self.kwargs})"
@@ -65,10 +92,29 @@ class Selection(OrderOrSelection):
 
             self.actions[k] = InList(v)
 
+        self.keys = self.remapping.components(self.actions.keys())
+
     def match_element(self, element):
+        # Only the elements derived from Base can prefetch their metadata
+        prefetch = getattr(element, "prefetch_metadata", None)
+        if prefetch is not None:
+            prefetch(self.keys)
         metadata = self.remapping(element.metadata)
         return all(v(metadata(k)) for k, v in self.actions.items())
 
+    def match_table(self, table):
+        """Returns a boolean mask of the elements of the :py:class:`MetadataTable`
+        that match, evaluating the actions once per distinct value.
+        """
+        import numpy as np
+
+        mask = np.ones(len(table), dtype=bool)
+        for k, v in self.actions.items():
+            codes, values = table.column(k, self.remapping)
+            matches = np.array([bool(v(x)) for x in values], dtype=bool)
+            mask &= matches[codes]
+        return mask
+
 
 class OrderBase(OrderOrSelection):
     def __init__(self, kwargs, remapping):
@@ -88,6 +134,32 @@ class OrderBase(OrderOrSelection):
                 return n
         return 0
 
+    def sort_table(self, table):
+        """Returns the indices of the elements of the :py:class:`MetadataTable`
+        in order. The distinct values of each key are sorted and replaced by their
+        rank, so that the elements are sorted with one stable `np.lexsort`.
+        """
+        import numpy as np
+
+        ranks = []
+        for k, v in self.actions.items():
+            codes, values = table.column(k, self.remapping)
+            order = sorted(
+                range(len(values)),
+                key=functools.cmp_to_key(lambda i, j: v(values[i], values[j])),
+            )
+            rank = np.zeros(len(values), dtype=np.int64)
+            for n in range(1, len(order)):
+                same = v(values[order[n - 1]], values[order[n]]) == 0
+                rank[order[n]] = rank[order[n - 1]] + (0 if same else 1)
+            ranks.append(rank[codes])
+
+        if not ranks:
+            return np.arange(len(table))
+
+        # The last key of np.lexsort is the primary one
+        return np.lexsort(ranks[::-1])
+
 
 class Order(OrderBase):
     def build_actions(self, kwargs):
@@ -155,10 +227,19 @@ class Order(OrderBase):
 
 
 class Index(Source):
+    _table = None
+
     @classmethod
     def new_mask_index(self, *args, **kwargs):
         return MaskIndex(*args, **kwargs)
 
+    def _metadata_table(self):
+        """Returns the :py:class:`MetadataTable` used by `sel()` and `order_by()`,
+        or None if the index does not keep one. Then `sel()` matches the elements
+        one by one, and `order_by()` reads their metadata in a temporary table.
+        """
+        return None
+
     @abstractmethod
     def __len__(self):
         self._not_implemented()
@@ -178,17 +259,21 @@ class Index(Source):
 
         selection = Selection(kwargs, remapping=remapping)
 
-        indices = (
-            i for i, element in enumerate(self) if selection.match_element(element)
-        )
+        table = self._metadata_table()
+        if table is not None:
+            indices = selection.match_table(table).nonzero()[0]
+        else:
+            indices = (
+                i for i, element in enumerate(self) if selection.match_element(element)
+            )
 
         return self.new_mask_index(self, indices)
 
     def order_by(self, *args, remapping=None, **kwargs):
         """Default order_by method.
-        It expects that calling self[i] returns an element that and Order object can rank
-        (i.e. order.get_element_ranking(element) -> tuple).
-        then it sorts the elements according to the tuples.
+        The metadata of each element is read once, and each value is replaced by
+        its rank among the distinct values of its key (see :py:meth:`Order.sort_table`).
+        Then the elements are sorted according to their ranks.
 
         Returns a new index object.
         """
@@ -202,12 +287,31 @@ class Index(Source):
 
         order = Order(kwargs, remapping=remapping)
 
-        def cmp(i, j):
-            return order.compare_elements(self[i], self[j])
+        table = self._metadata_table()
+        if table is None:
+            # Only used for this order
+            table = MetadataTable.from_elements(self)
 
-        indices = list(range(len(self)))
-        indices = sorted(indices, key=functools.cmp_to_key(cmp))
-        return self.new_mask_index(self, indices)
+        return self.new_mask_index(self, order.sort_table(table))
+
+    def unique_values(self, *coords, remapping=None, progress_bar=True):
+        """Returns the distinct values of each of `coords`, in order of first
+        appearance. The columns of the metadata table are used if the index has one.
+        """
+        table = self._metadata_table()
+        if table is None or not len(table):
+            return super().unique_values(
+                *coords, remapping=remapping, progress_bar=progress_bar
+            )
+
+        assert all(isinstance(k, str) for k in coords), coords
+
+        remapping = build_remapping(remapping)
+        result = {}
+        for k in coords:
+            _, values = compact(*table.column(k, remapping))
+            result[k] = tuple(dict.fromkeys(values))
+        return result
 
     def __getitem__(self, n):
         if isinstance(n, slice):
@@ -240,9 +344,7 @@ class Index(Source):
         return MultiIndex(sources)
 
     def to_numpy(self, *args, **kwargs):
-        import numpy as np
-
-        return np.array([f.to_numpy(*args, **kwargs) for f in self])
+        return fields_to_numpy(self, *args, **kwargs)
 
     def to_pytorch_tensor(self, *args, **kwargs):
         import torch
@@ -255,23 +357,44 @@ class Index(Source):
 
 class MaskIndex(Index):
     def __init__(self, index, indices):
+        import numpy as np
+
+        if isinstance(indices, np.ndarray):
+            indices = indices.astype(np.int64, copy=False)
+        else:
+            indices = np.fromiter(indices, dtype=np.int64)
+
+        # Masks of masks point directly to the root index,
+        # so that accessing an element is O(1) whatever the depth
+        if isinstance(index, MaskIndex):
+            indices = index.indices[indices]
+            index = index.index
+
         self.index = index
-        self.indices = list(indices)
+        self.indices = indices
 
     def _getitem(self, n):
-        n = self.indices[n]
+        n = int(self.indices[n])
         return self.index[n]
 
+    def _metadata_table(self):
+        if self._table is None:
+            table = self.index._metadata_table()
+            if table is not None:
+                self._table = table.take(self.indices, self)
+        return self._table
+
     def __len__(self):
         return len(self.indices)
 
     def __repr__(self):
-        return "MaskIndex(%r,%s)" % (self.index, self.indices)
+        return "MaskIndex(%r,%s)" % (self.index, self.indices.tolist())
 
 
 class MultiIndex(Index):
     def __init__(self, indexes, *args, **kwargs):
         self.indexes = list(indexes)
+        self._lengths = CumulativeLengths(self.indexes)
         super().__init__(*args, **kwargs)
         # self.indexes = list(i for i in indexes if len(i))
         # TODO: propagate  index._init_args, index._init_order_by, index._init_kwargs, for each i in indexes?
@@ -281,15 +404,19 @@ class MultiIndex(Index):
             return self
         return self.__class__(i.sel(*args, **kwargs) for i in self.indexes)
 
+    def _metadata_table(self):
+        if self._table is None:
+            tables = [i._metadata_table() for i in self.indexes]
+            if all(t is not None for t in tables):
+                self._table = MetadataTable.concat(tables)
+        return self._table
+
     def _getitem(self, n):
-        k = 0
-        while n >= len(self.indexes[k]):
-            n -= len(self.indexes[k])
-            k += 1
+        k, n = self._lengths.locate(n)
         return self.indexes[k][n]
 
     def __len__(self):
-        return sum(len(i) for i in self.indexes)
+        return len(self._lengths)
 
     def graph(self, depth=0):
         print(" " * depth, self.__class__.__name__)
@@ -304,35 +431,66 @@ class MultiIndex(Index):
 
 
 class FullIndex(Index):
+    """The elements of `index` arranged as a hypercube of the distinct values
+    of `coords`, in order of first appearance. Cells of the hypercube without
+    an element are holes, for which None is returned. In :py:meth:`to_numpy`,
+    the values of the holes are NaN.
+    """
+
     def __init__(self, index, *coords):
         import numpy as np
 
-        self.index = index
-
-        # Pass1, unique values
-        unique = index.unique_values(*coords)
-        shape = tuple(len(v) for v in unique.values())
-
-        name_to_index = defaultdict(dict)
+        assert len(coords)
 
-        for k, v in unique.items():
-            for i, e in enumerate(v):
-                name_to_index[k][e] = i
+        self.index = index
 
-        self.size = math.prod(shape)
-        self.shape = shape
-        self.holes = np.full(shape, False)
+        # One pass on the metadata, unless the index already has it
+        table = index._metadata_table()
+        if table is None:
+            table = MetadataTable.from_elements(index)
+        columns = [compact(codes, values) for codes, values in table.load(coords)]
 
-        for f in index:
-            idx = tuple(name_to_index[k][f.metadata(k)] for k in coords)
-            self.holes[idx] = True
+        self.shape = tuple(len(values) for _, values in columns)
+        self.size = math.prod(self.shape)
 
-        self.holes = self.holes.flatten()
-        print("+++++++++", self.holes.shape, coords, self.shape)
+        # Position in `index` of the element of each cell, -1 for holes
+        self.positions = np.full(self.size, -1, dtype=np.int64)
+        if len(table):
+            cells = np.ravel_multi_index([codes for codes, _ in columns], self.shape)
+            self.positions[cells] = np.arange(len(table))
 
     def __len__(self):
         return self.size
 
     def _getitem(self, n):
-        assert self.holes[n], f"Attempting to access hole {n}"
-        return self.index[sum(self.holes[:n])]
+        position = self.positions[n]
+        if position < 0:
+            return None
+        return self.index[int(position)]
+
+    def to_numpy(self, *args, dtype=None, out=None, **kwargs):
+        import numpy as np
+
+        present = np.flatnonzero(self.positions >= 0)
+        if len(present) == len(self):
+            return fields_to_numpy(self, *args, dtype=dtype, out=out, **kwargs)
+
+        values = fields_to_numpy(
+            [self.index[int(p)] for p in self.positions[present]],
+            *args,
+            dtype=dtype,
+            **kwargs,
+        )
+        if not np.issubdtype(values.dtype, np.inexact):
+            raise ValueError(
+                f"Cannot represent the holes of the hypercube with dtype {values.dtype}"
+            )
+
+        shape = (len(self),) + values.shape[1:]
+        if out is None:
+            out = np.empty(shape, dtype=values.dtype)
+        elif out.shape != shape:
+            raise ValueError(f"Invalid output shape {out.shape}, expected {shape}")
+        out.fill(np.nan)
+        out[present] = values
+        return out
@@ -42,6 +42,16 @@ class Remapping:
 
         return wrapped
 
+    def components(self, names):
+        """Returns the names of the metadata needed to compute `names`"""
+        result = []
+        for name in names:
+            if name in self.remapping:
+                result.extend(self.remapping[name][1::2])
+            else:
+                result.append(name)
+        return result
+
     def substitute(self, name, joiner):
         if name in self.remapping:
             lst = []
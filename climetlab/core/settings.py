@@ -98,12 +98,66 @@ SETTINGS_AND_HELP = {
         5,
         """Number of threads used to download data.""",
     ),
+    "number-of-grib-scanning-workers": _(
+        0,
+        """Number of processes used to find the messages of several GRIB files at once.
+        Set to 0 to use one process per CPU, and to 1 to scan the files sequentially.""",
+    ),
+    "number-of-grib-indexing-workers": _(
+        0,
+        """Number of processes used to parse the GRIB files of a directory when indexing it.
+        The entries are inserted in the database by a single process.
+        Set to 0 to use one process per CPU, and to 1 to parse the files sequentially.""",
+    ),
+    "number-of-length-threads": _(
+        1,
+        """Number of threads used to compute the lengths of the sources of a merge
+        when its total length is first needed. Set to 0 to use one thread per CPU,
+        and to 1 to compute them sequentially.""",
+    ),
+    "number-of-entries-per-insert": _(
+        10000,
+        """Number of entries inserted at once in the SQLite databases of the GRIB indexes.""",
+    ),
+    "use-fast-sqlite-loading": _(
+        False,
+        """Load the SQLite databases of the GRIB indexes with journal_mode=WAL,
+        synchronous=OFF and temp_store=MEMORY. This is faster, but a database may be
+        corrupted if the system crashes while it is loaded.""",
+    ),
     "maximum-cache-size": _(
         None,
         """Maximum disk space used by the CliMetLab cache (ex: 100G or 2T).""",
         getter="_as_bytes",
         none_ok=True,
     ),
+    "maximum-grib-fields-memory": _(
+        None,
+        """Maximum memory used by the decoded values and the eccodes handles of GRIB fields (ex: 4G).
+        When it is exceeded, the least recently used ones are released, and decoded again when needed.""",
+        getter="_as_bytes",
+        none_ok=True,
+    ),
+    "use-numpy-grib-decoder": _(
+        False,
+        """Decode the GRIB fields packed with simple packing with NumPy instead of eccodes.
+        Other packings are always decoded by eccodes.""",
+    ),
+    "use-native-grib-header-parser": _(
+        False,
+        """When indexing GRIB files, read the MARS keys from the headers of the messages
+        in Python, calling eccodes only for the first message of each kind.""",
+    ),
+    "maximum-open-grib-files": _(
+        512,
+        """Maximum number of GRIB files kept open to read their fields.
+        It is capped at half the limit on open files of the process.""",
+    ),
+    "cache-grib-geometry": _(
+        False,
+        """Store the latitudes and longitudes of the GRIB grids in the cache directory,
+        so that they are not computed again for each new session.""",
+    ),
     "maximum-cache-disk-usage": _(
         "90%",
         """Disk usage threshold after which CliMetLab expires older cached entries (% of the full disk capacity).
@@ -0,0 +1,158 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+
+def _category(value):
+    # 1, 1.0 and True are different values
+    return (type(value), value)
+
+
+def compact(codes, values):
+    """Returns the column (`codes`, `values`) with only the values used by the
+    codes, in order of first appearance. The columns of tables created by
+    :py:meth:`MetadataTable.take` keep all the values of the original table.
+    """
+    present, first = np.unique(codes, return_index=True)
+    present = present[np.argsort(first, kind="stable")]
+
+    mapping = np.zeros(len(values), dtype=np.int64)
+    mapping[present] = np.arange(len(present))
+    return mapping[codes], [values[i] for i in present]
+
+
+class MetadataTable:
+    """Metadata of the elements of an index, stored by columns. The column of
+    a key holds the distinct values of that key and for each element the code
+    (position) of its value. Columns are only built for the keys that are used,
+    the first time they are used.
+
+    `build(names)` returns the columns of `names` as a dict.
+    """
+
+    def __init__(self, length, build):
+        self.length = length
+        self.build = build
+        self.columns = {}
+
+    def __len__(self):
+        return self.length
+
+    def load(self, names):
+        """Returns the columns of `names`, as a list of (codes, values) tuples"""
+        missing = [n for n in dict.fromkeys(names) if n not in self.columns]
+        if missing:
+            self.columns.update(self.build(missing))
+        return [self.columns[n] for n in names]
+
+    def column(self, name, remapping):
+        """Returns the column of `name`, which may be a combination of
+        several keys according to `remapping`
+        """
+        components = remapping.components([name])
+        if components == [name]:
+            return self.load([name])[0]
+
+        columns = self.load(components)
+        codes = np.zeros((self.length, len(components)), dtype=np.int64)
+        for i, (c, _) in enumerate(columns):
+            codes[:, i] = c
+
+        # The remapping is only computed once per distinct combination of values
+        unique, inverse = np.unique(codes, axis=0, return_inverse=True)
+        values = []
+        for row in unique:
+            metadata = {k: v[i] for k, (_, v), i in zip(components, columns, row)}
+            values.append(remapping(metadata.get)(name))
+
+        return inverse.reshape(-1), values
+
+    @classmethod
+    def from_elements(cls, index):
+        """Table of the metadata of the elements of `index`, read element by element"""
+
+        def build(names):
+            categories = [{} for _ in names]
+            values = [[] for _ in names]
+            codes = [np.empty(len(index), dtype=np.int64) for _ in names]
+
+            for i, element in enumerate(index):
+                prefetch = getattr(element, "prefetch_metadata", None)
+                if prefetch is not None:
+                    prefetch(names)
+
+                for j, name in enumerate(names):
+                    value = element.metadata(name)
+                    code = categories[j].setdefault(_category(value), len(values[j]))
+                    if code == len(values[j]):
+                        values[j].append(value)
+                    codes[j][i] = code
+
+            return {n: (c, v) for n, c, v in zip(names, codes, values)}
+
+        return cls(len(index), build)
+
+    def take(self, indices, elements):
+        """Table of the elements at `indices`, which are also the elements of the
+        index `elements`. The columns already loaded in this table are shared, the
+        others are read from `elements` only, not from all the elements of this table.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+
+        def build(names):
+            result = {}
+            for n in names:
+                if n in self.columns:
+                    codes, values = self.columns[n]
+                    result[n] = (codes[indices], values)
+
+            missing = [n for n in names if n not in result]
+            if missing:
+                result.update(MetadataTable.from_elements(elements).build(missing))
+            return result
+
+        return MetadataTable(len(indices), build)
+
+    @classmethod
+    def concat(cls, tables):
+        """Table of the elements of all `tables`, one after the other"""
+
+        def build(names):
+            # Each table only reads the metadata of its own elements,
+            # once for all the names
+            loaded = [table.load(names) for table in tables]
+
+            result = {}
+            for j, name in enumerate(names):
+                categories = {}
+                values = []
+                codes = []
+                for columns in loaded:
+                    c, v = columns[j]
+                    # Codes of the values of each table in the merged column
+                    mapping = np.empty(len(v), dtype=np.int64)
+                    for i, value in enumerate(v):
+                        mapping[i] = categories.setdefault(
+                            _category(value), len(values)
+                        )
+                        if mapping[i] == len(values):
+                            values.append(value)
+                    codes.append(mapping[c])
+                result[name] = (
+                    np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64),
+                    values,
+                )
+            return result
+
+        return cls(sum(len(t) for t in tables), build)
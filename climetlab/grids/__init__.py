@@ -168,8 +168,16 @@ def ecef(lat, lon, i):
 def unstructed_to_structed(grib, chunk_size=-1):
     now = time.time()
     print("----")
-    xyz = np.array(
-        [ecef(lat, lon, i) for i, (lat, lon) in enumerate(grib.iterate_grid_points())]
+    lat, lon = grib.grid_points()
+    lat, lon = np.deg2rad(lat), np.deg2rad(lon)
+    cos_lat = np.cos(lat)
+    xyz = np.column_stack(
+        [
+            cos_lat * np.cos(lon),
+            cos_lat * np.sin(lon),
+            np.sin(lat),
+            np.arange(len(lat)),
+        ]
     )
     print("----", time.time() - now)
     print(len(xyz))
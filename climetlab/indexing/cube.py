@@ -168,8 +168,25 @@ class FieldCube:
             flatten_values=self.flatten_values,
         )
 
-    def to_numpy(self, **kwargs):
-        return self.source.to_numpy(**kwargs).reshape(*self.extended_user_shape)
+    def to_numpy(self, out=None, **kwargs):
+        kwargs.setdefault("reshape", not self.flatten_values)
+        if out is None:
+            # The fields are decoded into a single contiguous array,
+            # so reshaping it does not copy
+            return self.source.to_numpy(**kwargs).reshape(*self.extended_user_shape)
+
+        if out.shape != self.extended_user_shape:
+            raise ValueError(
+                f"Invalid output shape {out.shape}, expected {self.extended_user_shape}"
+            )
+        if not out.flags.c_contiguous:
+            raise ValueError("The output array must be C-contiguous")
+
+        self.source.to_numpy(
+            out=out.reshape((len(self.source),) + self.field_shape),
+            **kwargs,
+        )
+        return out
 
     def _names(self, coords, reading_chunks=None, **kwargs):
         if reading_chunks is None:
@@ -16,6 +16,36 @@ STATISTICS_KEY_NAMES = ["mean", "std", "min", "max", "shape"]
 MORE_KEY_NAMES_WITH_UNDERSCORE = ["_param_id"]
 MORE_KEY_NAMES = ["datetime", "param_level"]
 
+GRIB_KEYS_NAMES = [
+    "class",
+    "stream",
+    "levtype",
+    "type",
+    "expver",
+    "date",
+    "hdate",
+    "andate",
+    "time",
+    "antime",
+    "reference",
+    "step",
+    "anoffset",
+    "verify",
+    "fcmonth",
+    "fcperiod",
+    "leadtime",
+    "opttime",
+    "origin",
+    "domain",
+    "method",
+    "diagnostic",
+    "iteration",
+    "number",
+    "quantile",
+    "levelist",
+    "param",
+]
+
 
 class DBKey:
     cast = None
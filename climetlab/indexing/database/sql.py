@@ -14,11 +14,13 @@ import logging
 import os
 import sqlite3
 import time
+from contextlib import contextmanager
 from threading import local
 
 import numpy as np
 
 import climetlab as cml
+from climetlab.core.settings import SETTINGS
 from climetlab.indexing.database.json import json_serialiser
 from climetlab.loaders import build_remapping
 from climetlab.utils import tqdm
@@ -51,6 +53,14 @@ def dump_sql(statement):
 
 
 def execute(connection, statement, *arg, **kwargs):
+    return _retry(connection.execute, statement, *arg, **kwargs)
+
+
+def executemany(connection, statement, rows):
+    return _retry(connection.executemany, statement, rows)
+
+
+def _retry(method, statement, *arg, **kwargs):
     if LOG.level == logging.DEBUG:
         assert False
         dump_sql(statement)
@@ -58,17 +68,42 @@ def execute(connection, statement, *arg, **kwargs):
     delay = 1
     while delay < 30 * 60:  # max delay 30 min
         try:
-            return connection.execute(statement, *arg, **kwargs)
+            return method(statement, *arg, **kwargs)
         except sqlite3.OperationalError as e:
             if not str(e).endswith("database is locked"):
                 raise e
+            LOG.warning(f"{e}. Retrying in {delay} seconds.")
             time.sleep(delay)
-            dump_sql(statement)
-            print(f"{e}. Retrying in {delay} seconds.")
             delay = delay * 1.5
     raise e  # noqa: F821
 
 
+@contextmanager
+def fast_loading(connection):
+    """Relaxes the durability of the database while entries are loaded, if the
+    setting `use-fast-sqlite-loading` is set. These pragmas cannot be changed
+    within a transaction.
+    """
+    if not SETTINGS.get("use-fast-sqlite-loading"):
+        yield
+        return
+
+    previous = {
+        name: execute(connection, f"PRAGMA {name};").fetchone()[0]
+        for name in ("synchronous", "temp_store")
+    }
+
+    # The journal mode persists in the file
+    execute(connection, "PRAGMA journal_mode=WAL;")
+    execute(connection, "PRAGMA synchronous=OFF;")
+    execute(connection, "PRAGMA temp_store=MEMORY;")
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            execute(connection, f"PRAGMA {name}={value};")
+
+
 def entryname_to_dbname(n):
     n = dict(
         levellist="levelist",
@@ -197,40 +232,81 @@ class EntriesLoader:
         name = entryname_to_dbname(k)
         return klass(name)
 
-    def load_iterator(self, iterator):
+    def delete_paths(self, keys):
+        """Deletes the entries of the files `keys`, and the files themselves"""
+        keys = list(keys)
+        if "path" in self.keys:
+            statement = f"DELETE FROM {self.table_name} WHERE path=?;"
+            executemany(self.connection, statement, [(k,) for k in keys])
+        self.path_table.delete(keys)
+
+    def load_iterator(self, iterator, batch_size=None, stats=None):
+        """Inserts the entries of `iterator`, `batch_size` at a time, in the
+        transaction of the connection. New keys add columns to the table.
+        `stats` maps the paths of the entries to the (size, mtime, inode)
+        recorded with them.
+        """
+        stats = stats or {}
+
+        if batch_size is None:
+            batch_size = SETTINGS.get("number-of-entries-per-insert")
+        batch_size = max(1, batch_size)
+
         paths_or_urls = set()
 
+        # Database names of the keys already seen
+        dbnames = {}
+        statement = None
+        batch = []
+
+        def flush():
+            if batch:
+                executemany(self.connection, statement, batch)
+                batch.clear()
+
         count = 0
         for entry in iterator:
             if count == 0:
                 self.keys = self.create_table_from_entry_if_needed(entry)
 
             for k, v in entry.items():
-                dbname = entryname_to_dbname(k)
+                if k in dbnames:
+                    continue
+                dbname = dbnames[k] = entryname_to_dbname(k)
                 if dbname not in self.keys:
                     LOG.debug(f"Inserting column in databse {k}, {dbname}")
+                    # The pending entries do not have this column
+                    flush()
                     self.keys = self._add_column(k, v)
+                    statement = None
+
+            if statement is None:
+                column_names = list(self.keys.keys())
+                entrynames = [dbname_to_entryname(k) for k in column_names]
+                statement = (
+                    f"INSERT INTO {self.table_name} ("
+                    + ",".join(column_names)
+                    + ") VALUES("
+                    + ",".join(["?"] * len(column_names))
+                    + ");"
+                )
 
             if "_path" in entry:
                 paths_or_urls.add(entry["_path"])
             if "_url" in entry:
                 paths_or_urls.add(entry["_url"])
 
-            column_names = [k for k, v in self.keys.items()]
-            statement = (
-                f"INSERT INTO {self.table_name} ("
-                + ",".join(column_names)
-                + ") VALUES("
-                + ",".join(["?"] * len(column_names))
-                + ");"
-            )
-            values = [entry.get(dbname_to_entryname(k)) for k, v in self.keys.items()]
-            execute(self.connection, statement, tuple(values))
+            batch.append(tuple(entry.get(n) for n in entrynames))
+            if len(batch) >= batch_size:
+                flush()
+
             count += 1
 
+        flush()
+
         date = datetime.datetime.now().isoformat()
         for path in paths_or_urls:
-            self.path_table.insert(path, date)
+            self.path_table.insert(path, date, stats.get(path))
 
         return count
 
@@ -425,7 +501,10 @@ class SqlOrder(SqlFilter):
 
 
 class VersionedDatabaseMixin:
-    VERSION = 6
+    VERSION = 7
+
+    # Databases of these versions are upgraded in place by _upgrade()
+    UPGRADABLE_VERSIONS = (6,)
 
     @property
     def _version(self):
@@ -436,11 +515,19 @@ class VersionedDatabaseMixin:
         assert False
 
     def _set_version(self):
-        if self._version is None:
+        version = self._version
+        if version in self.UPGRADABLE_VERSIONS:
+            LOG.info(f"Upgrading database index from version {version}")
+            self._upgrade(version)
+            version = None
+        if version is None:
             execute(self.connection, f"PRAGMA user_version = {self.VERSION};")
             return
         self._check_version()
 
+    def _upgrade(self, version):
+        raise NotImplementedError()
+
     def _check_version(self):
         version = self._version
         if version is None or version == self.VERSION:
@@ -448,36 +535,75 @@ class VersionedDatabaseMixin:
         raise Exception(
             (
                 "Version mismatch: current version for database index"
-                " is {self.VERSION} and the database already has version"
-                f" {version}"
+                f" is {self.VERSION} and the database already has version"
+                f" {version}, which cannot be upgraded. Please delete the"
+                " database and index the data again."
             )
         )
 
 
 class PathTable:
+    """The files and urls loaded in the database, with the size, the
+    modification time and the inode of the files when they were loaded.
+    """
+
     table_name = "paths"
+    columns = dict(key="TEXT PRIMARY KEY", date="TEXT")
+    stat_columns = dict(size="INTEGER", mtime="FLOAT", inode="INTEGER")
 
     def __init__(self, connection):
         self.connection = connection
         self.ensure_table()
 
     def ensure_table(self):
-        statement = f"CREATE TABLE IF NOT EXISTS {self.table_name} (key TEXT PRIMARY KEY, date TEXT);"
+        columns = ",".join(
+            f"{k} {v}" for k, v in dict(**self.columns, **self.stat_columns).items()
+        )
+        statement = f"CREATE TABLE IF NOT EXISTS {self.table_name} ({columns});"
         for i in execute(self.connection, statement):
             LOG.error(str(i))  # Output of .execute should be empty
 
-    def insert(self, key, date):
-        statement = f"""INSERT INTO {self.table_name} (key, date) VALUES(?,?);"""
+        # Tables created by previous versions do not have the stat columns
+        cursor = execute(self.connection, f"PRAGMA table_info({self.table_name})")
+        existing = [x[1] for x in cursor.fetchall()]
+        for k, v in self.stat_columns.items():
+            if k in existing:
+                continue
+            try:
+                execute(
+                    self.connection,
+                    f"ALTER TABLE {self.table_name} ADD COLUMN {k} {v};",
+                )
+            except sqlite3.OperationalError:
+                LOG.debug("Add column failed, this is expected because of concurency")
+
+    def insert(self, key, date, stat=None):
+        size, mtime, inode = stat if stat is not None else (None, None, None)
+        statement = f"""INSERT OR REPLACE INTO {self.table_name} (key, date, size, mtime, inode) VALUES(?,?,?,?,?);"""
+        LOG.debug("%s", statement)
+        execute(self.connection, statement, (key, date, size, mtime, inode))
+
+    def delete(self, keys):
+        statement = f"""DELETE FROM {self.table_name} WHERE key=?;"""
         LOG.debug("%s", statement)
-        execute(self.connection, statement, (key, date))
+        executemany(self.connection, statement, [(k,) for k in keys])
 
     def get_date(self, key):
-        statement = f"""SELECT * FROM {self.table_name} WHERE key="{key}";"""
+        statement = f"""SELECT date FROM {self.table_name} WHERE key=?;"""
         LOG.debug("%s", statement)
-        for key, date in execute(self.connection, statement):
+        for (date,) in execute(self.connection, statement, (key,)):
             return date
         return None
 
+    def get_stats(self):
+        """Returns the (size, mtime, inode) of each key"""
+        statement = f"""SELECT key, size, mtime, inode FROM {self.table_name};"""
+        LOG.debug("%s", statement)
+        return {
+            key: (size, mtime, inode)
+            for key, size, mtime, inode in execute(self.connection, statement)
+        }
+
 
 class SqlDatabase(Database, VersionedDatabaseMixin):
     EXTENSION = ".db"
@@ -553,13 +679,37 @@ class SqlDatabase(Database, VersionedDatabaseMixin):
             date = PathTable(connection).get_date(path_or_url)
             return date is not None
 
-    def load_iterator(self, iterator):
+    def paths_stats(self):
+        """Returns the (size, mtime, inode) of the files loaded, when they were
+        loaded. They are None for the files loaded by previous versions.
+        """
+        with self.connection as connection:
+            return PathTable(connection).get_stats()
+
+    def delete_paths(self, keys):
+        """Deletes the entries of the files `keys`, in one transaction"""
         with self.connection as connection:
+            EntriesLoader(connection).delete_paths(keys)
+
+    def _upgrade(self, version):
+        # Version 7 added the size, mtime and inode of the files to the paths table
+        assert version == 6, version
+        PathTable(self.connection).ensure_table()
+
+    def load_iterator(self, iterator, stats=None, replace=()):
+        """Inserts the entries of `iterator` in one transaction. `stats` maps
+        the paths of the entries to their (size, mtime, inode). The previous
+        entries of the files `replace` are deleted in the same transaction.
+        """
+        with fast_loading(self.connection), self.connection as connection:
+            self._set_version()
             loader = EntriesLoader(connection)
-            count = loader.load_iterator(iterator)
+            if replace:
+                loader.delete_paths(replace)
+            count = loader.load_iterator(iterator, stats=stats)
             self.dbkeys = loader.keys
 
-            assert count >= 1, "No entry found."
+            assert count >= 1 or replace, "No entry found."
             LOG.info("Added %d entries", count)
 
         return count
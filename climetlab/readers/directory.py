@@ -13,6 +13,7 @@ import os
 import shutil
 
 from climetlab import load_source
+from climetlab.readers.grib import index_grib_files
 
 from . import Reader
 from . import reader as find_reader
@@ -68,6 +69,8 @@ class DirectoryReader(Reader):
         if os.path.exists(os.path.join(self.path, ".zattrs")):
             return load_source("zarr", self.path)
 
+        index_grib_files(self._content)
+
         return load_source(
             "multi",
             [
@@ -7,10 +7,34 @@
 # nor does it submit to any jurisdiction.
 #
 import logging
+import os
 
 LOG = logging.getLogger(__name__)
 
 
+def index_grib_files(paths):
+    """Find the messages of the GRIB files among `paths` concurrently,
+    so that the corresponding readers can be opened without scanning them.
+    """
+    gribs = []
+    for path in paths:
+        if isinstance(path, str) and os.path.isfile(path):
+            with open(path, "rb") as f:
+                if f.read(4) == b"GRIB":
+                    gribs.append(path)
+
+    if len(gribs) < 2:
+        return
+
+    from .index.file import build_positions_indexes
+
+    try:
+        build_positions_indexes(gribs)
+    except Exception:
+        # The files will be scanned one by one when opened
+        LOG.exception("Failed to index GRIB files concurrently")
+
+
 def reader(source, path, magic=None, deeper_check=False):
     if magic is None or magic[:4] == b"GRIB":
         from .reader import GRIBReader
@@ -11,14 +11,15 @@ import datetime
 import logging
 import os
 import threading
-import time
-from itertools import islice
+from collections import OrderedDict
 
 import eccodes
 
 from climetlab.core import Base
 from climetlab.core.constants import DATETIME
+from climetlab.core.settings import SETTINGS
 from climetlab.profiling import call_counter
+from climetlab.readers.grib.memory import MEMORY
 from climetlab.utils.bbox import BoundingBox
 
 LOG = logging.getLogger(__name__)
@@ -88,8 +89,80 @@ def get_messages_positions(path):
         os.close(fd)
 
 
+def _grib1_large_message_length(mm, offset, length):
+    # GRIB1 messages larger than 8MB encode their length in units of 120 bytes,
+    # corrected using the length of section 4
+    sec1 = offset + 8
+    sec1len = int.from_bytes(mm[sec1 : sec1 + 3], byteorder="big")
+    flags = mm[sec1 + 7]
+
+    position = sec1 + sec1len
+
+    if flags & (1 << 7):
+        sec2len = int.from_bytes(mm[position : position + 3], byteorder="big")
+        position += sec2len
+
+    if flags & (1 << 6):
+        sec3len = int.from_bytes(mm[position : position + 3], byteorder="big")
+        position += sec3len
+
+    sec4len = int.from_bytes(mm[position : position + 3], byteorder="big")
+
+    if sec4len < 120:
+        length &= 0x7FFFFF
+        length *= 120
+        length -= sec4len
+        length += 4
+
+    return length
+
+
+def scan_messages_positions(path):
+    """Return the offsets and lengths of the GRIB messages in `path` as two
+    int64 NumPy arrays. The file is memory-mapped and the scanner jumps from one
+    message to the next, only searching for the next "GRIB" marker when needed.
+    """
+    import mmap
+
+    import numpy as np
+
+    offsets = []
+    lengths = []
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = mm.find(b"GRIB")
+            while offset >= 0 and offset + 16 <= size:
+                length = int.from_bytes(mm[offset + 4 : offset + 7], byteorder="big")
+                edition = mm[offset + 7]
+
+                if edition == 1 and length & 0x800000:
+                    length = _grib1_large_message_length(mm, offset, length)
+
+                if edition == 2:
+                    length = int.from_bytes(
+                        mm[offset + 8 : offset + 16], byteorder="big"
+                    )
+
+                if length <= 0:
+                    offset = mm.find(b"GRIB", offset + 4)
+                    continue
+
+                offsets.append(offset)
+                lengths.append(length)
+
+                offset = mm.find(b"GRIB", offset + length)
+
+    return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
 eccodes_codes_release = call_counter(eccodes.codes_release)
 eccodes_codes_new_from_file = call_counter(eccodes.codes_new_from_file)
+eccodes_codes_new_from_message = call_counter(eccodes.codes_new_from_message)
 
 # For some reason, cffi can ge stuck in the GC if that function
 # needs to be called defined for the first time in a GC thread.
@@ -102,6 +175,42 @@ except:  # noqa E722
     pass
 
 
+# Native types of commonly used keys, so that they can be
+# fetched without first querying their size and type. Keys with
+# a different native type in GRIB1 and GRIB2 (e.g. "param") are not here
+KEY_TYPES = {
+    "class": str,
+    "stream": str,
+    "type": str,
+    "expver": str,
+    "levtype": str,
+    "domain": str,
+    "shortName": str,
+    "typeOfLevel": str,
+    "gridType": str,
+    "stepRange": str,
+    "stepType": str,
+    "units": str,
+    "dataType": str,
+    "paramId": int,
+    "level": int,
+    "levelist": int,
+    "date": int,
+    "time": int,
+    "step": int,
+    "endStep": int,
+    "number": int,
+    "validityDate": int,
+    "validityTime": int,
+    "dataDate": int,
+    "dataTime": int,
+    "edition": int,
+    "Ni": int,
+    "Nj": int,
+    "numberOfDataPoints": int,
+}
+
+
 class CodesHandle:
     def __init__(self, handle, path, offset):
         self.handle = handle
@@ -162,6 +271,31 @@ class CodesHandle:
         except eccodes.KeyValueNotFoundError:
             return None
 
+    def get_many(self, names, types=None):
+        """Returns a dictionary with the values of all the keys in `names`.
+        `types` is either a dictionary or a list parallel to `names` giving the type
+        (str, int or float) of each key. Keys of unknown types are fetched with get().
+        """
+        if types is None:
+            types = {}
+        elif not isinstance(types, dict):
+            types = dict(zip(names, types))
+
+        getters = {
+            str: self.get_string,
+            int: self.get_long,
+            float: self.get_double,
+        }
+
+        result = {}
+        for name in names:
+            kind = types.get(name, KEY_TYPES.get(name))
+            if kind is None:
+                result[name] = self.get(name)
+            else:
+                result[name] = getters[kind](name)
+        return result
+
     def get_long(self, name):
         try:
             return eccodes.codes_get_long(self.handle, name)
@@ -183,6 +317,12 @@ class CodesHandle:
     def get_data(self):
         return eccodes.codes_grib_get_data(self.handle)
 
+    def get_latitudes_longitudes(self):
+        return (
+            eccodes.codes_get_double_array(self.handle, "latitudes"),
+            eccodes.codes_get_double_array(self.handle, "longitudes"),
+        )
+
     def as_mars(self, param="shortName"):
         r = {}
         it = eccodes.codes_keys_iterator_new(self.handle, "mars")
@@ -260,33 +400,202 @@ class CodesHandle:
             return f.read(length)
 
 
-class ReaderLRUCache(dict):
-    def __init__(self, size):
-        self.readers = dict()
+def _max_open_files():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return None
+
+    # Leave some file descriptors for the rest of the process
+    return max(1, soft // 2)
+
+
+class ReaderLRUCache:
+    """Least recently used cache of open CodesReader, one per path.
+    Its size is given by the 'maximum-open-grib-files' setting, and
+    is capped at half the process limit on open files.
+    """
+
+    def __init__(self, size=None):
+        self._size = size
+        self._reset()
+
+        # PyTorch will fork and leave the cache in a funny state
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+        SETTINGS.on_change(self.settings_changed)
+
+    def _reset(self):
+        # The file objects are shared with the parent process after a
+        # fork, and the lock may have been held by another thread
         self.lock = threading.Lock()
-        self.size = size
+        self.readers = OrderedDict()
+        self.pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._max = None
+
+    def settings_changed(self):
+        self._max = None
+
+    @property
+    def size(self):
+        if self._max is None:
+            size = self._size
+            if size is None:
+                size = SETTINGS.get("maximum-open-grib-files")
+            limit = _max_open_files()
+            if limit is not None:
+                size = min(size, limit)
+            self._max = max(1, size)
+        return self._max
 
     def __getitem__(self, path):
-        key = (
-            path,
-            os.getpid(),
-        )  # PyTorch will fork and leave the cache in a funny state
+        if self.pid != os.getpid():
+            self._reset()
+
         with self.lock:
-            try:
-                return super().__getitem__(key)
-            except KeyError:
-                pass
+            reader = self.readers.get(path)
+            if reader is not None:
+                self.readers.move_to_end(path)
+                self.hits += 1
+                return reader
+
+            self.misses += 1
+            size = self.size
+
+            while len(self.readers) >= size:
+                self.readers.popitem(last=False)
+                self.evictions += 1
+
+            reader = self.readers[path] = CodesReader(path)
+            return reader
+
+    def __len__(self):
+        return len(self.readers)
+
+    def statistics(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            open=len(self.readers),
+            size=self.size,
+        )
+
+
+cache = ReaderLRUCache()
+
+
+class HeaderHandle(CodesHandle):
+    """Handle on the `length` bytes of the headers of a GRIB message followed by
+    an empty data section, see :py:func:`header_message`. `sizes` gives the values
+    of the keys that depend on the length of the data section in the original message.
+    """
+
+    def __init__(self, handle, path, offset, length, sizes):
+        super().__init__(handle, path, offset)
+        self.length = length
+        self.sizes = sizes
+
+    def get(self, name):
+        if name in self.sizes:
+            return self.sizes[name]
+        return super().get(name)
+
+    def get_long(self, name):
+        if name in self.sizes:
+            return self.sizes[name]
+        return super().get_long(name)
+
+    def get_double(self, name):
+        if name in self.sizes:
+            return float(self.sizes[name])
+        return super().get_double(name)
+
+
+def header_message(read, length):
+    """Returns the headers of the GRIB message of `length` bytes read with
+    `read(offset, length)`, followed by an empty data section, so that eccodes can
+    create a handle on them. Also returns the values of the keys that depend on
+    the length of the data section. Returns None if the message is not supported.
+    """
+    start = read(0, 16)
+    if len(start) < 16 or start[:4] != b"GRIB":
+        return None
+
+    def uint(b, i, n):
+        return int.from_bytes(b[i : i + n], "big")
+
+    if start[7] == 2:
+        # The data section (7) is the last one, unless there are several
+        # fields in the message, which is not supported
+        offset = 16
+        while offset < length - 4:
+            section = read(offset, 5)
+            if len(section) < 5 or uint(section, 0, 4) < 5:
+                return None
+            if section[4] == 7:
+                break
+            offset += uint(section, 0, 4)
+        else:
+            return None
+        if offset + uint(section, 0, 4) != length - 4:
+            return None
 
-            c = self[key] = CodesReader(path)
+        message = bytearray(read(0, offset))
+        message += (5).to_bytes(4, "big") + b"\x07" + b"7777"
+        message[8:16] = len(message).to_bytes(8, "big")
+        sizes = dict(
+            totalLength=length,
+            section7Length=length - 4 - offset,
+            offsetAfterData=length - 4,
+        )
+        return bytes(message), sizes
 
-            while len(self) >= self.size:
-                _, oldest = min((v.last, k) for k, v in self.items())
-                del self[oldest]
+    if start[7] == 1:
+        # The lengths of large messages are encoded differently
+        if uint(start, 4, 3) & 0x800000:
+            return None
 
-            return c
+        offset = 8 + uint(start, 8, 3)
+        flag = start[15]
+        if flag & 0x80:  # Grid section
+            offset += uint(read(offset, 3), 0, 3)
+        if flag & 0x40:  # Bitmap section
+            offset += uint(read(offset, 3), 0, 3)
+
+        # The first 11 bytes of the data section (4) hold the packing parameters,
+        # unless there are additional flags or it uses complex packing
+        message = bytearray(read(0, offset + 11))
+        if len(message) < offset + 11 or message[offset + 3] & 0x50:
+            return None
 
+        section_length = length - 4 - offset
+        flags, bits_per_value = message[offset + 3], message[offset + 10]
+
+        # One byte of padding, all of its bits unused
+        message[offset : offset + 3] = (12).to_bytes(3, "big")
+        message[offset + 3] = flags & 0xF0 | 8
+        message += b"\x00" + b"7777"
+        message[4:7] = len(message).to_bytes(3, "big")
+        sizes = dict(
+            totalLength=length,
+            section4Length=section_length,
+            offsetAfterData=length - 4,
+        )
+        if bits_per_value > 0:
+            available = (section_length - 11) * 8 - (flags & 0x0F)
+            sizes["numberOfCodedValues"] = available // bits_per_value
+        return bytes(message), sizes
 
-cache = ReaderLRUCache(512)  # TODO: Add to config
+    return None
 
 
 class CodesReader:
@@ -294,7 +603,6 @@ class CodesReader:
         self.path = path
         self.lock = threading.Lock()
         self.file = open(self.path, "rb")
-        self.last = time.time()
 
     def __del__(self):
         try:
@@ -306,9 +614,43 @@ class CodesReader:
     def from_cache(cls, path):
         return cache[path]
 
-    def at_offset(self, offset):
+    def read_bytes(self, offset, length):
+        if not hasattr(os, "pread"):  # Windows
+            with self.lock:
+                self.file.seek(offset, 0)
+                return self.file.read(length)
+
+        # os.pread() does not change the position of the file,
+        # so several threads can read at the same time
+        fd = self.file.fileno()
+        data = os.pread(fd, length, offset)
+        while 0 < len(data) < length:
+            more = os.pread(fd, length - len(data), offset + len(data))
+            if not more:
+                break
+            data += more
+        return data
+
+    def at_offset(self, offset, length=None, headers_only=False):
+        if length is not None and headers_only:
+            # Only the headers are read, eccodes creates a handle on them followed
+            # by an empty data section. Partial messages built in memory miss some
+            # keys (e.g. gridType), and headers_only is ignored by eccodes' Python API.
+            header = header_message(
+                lambda start, size: self.read_bytes(offset + start, size), length
+            )
+            if header is not None:
+                message, sizes = header
+                handle = eccodes_codes_new_from_message(message)
+                return HeaderHandle(handle, self.path, offset, len(message), sizes)
+
+        if length is not None:
+            data = self.read_bytes(offset, length)
+            assert len(data) == length, (self.path, offset, length, len(data))
+            handle = eccodes_codes_new_from_message(data)
+            return CodesHandle(handle, self.path, offset)
+
         with self.lock:
-            self.last = time.time()
             self.file.seek(offset, 0)
             handle = eccodes_codes_new_from_file(
                 self.file,
@@ -318,27 +660,114 @@ class CodesReader:
             return CodesHandle(handle, self.path, offset)
 
 
+# GRIB keys needed by GribField.metadata() for some metadata names
+METADATA_KEYS = {
+    DATETIME: ("validityDate", "validityTime"),
+    "param": ("shortName",),
+    "_param_id": ("paramId",),
+}
+
+# GRIB keys that need the data section of the message, and so cannot
+# be read from a headers only handle (see HeaderHandle for the ones that can)
+DATA_KEYS = {
+    "values",
+    "codedValues",
+    "latitudes",
+    "longitudes",
+    "distinctLatitudes",
+    "distinctLongitudes",
+    "latitudeLongitudeValues",
+    "numberOfMissing",
+    "numberOfCodedValues",
+    "maximum",
+    "minimum",
+    "average",
+    "standardDeviation",
+    "skewness",
+    "kurtosis",
+    "isConstant",
+    "dataLength",
+    "getNumberOfValues",
+    "md5Headers",
+    "md5Section4",
+    "md5Section7",
+}
+
+
 class GribField(Base):
     def __init__(self, path, offset, length):
         self.path = path
         self._offset = offset
         self._length = length
         self._handle = None
+        self._header = None
         self._values = None
         self._cache = {}
+        self._memory = {}
 
     @property
     def handle(self):
-        if self._handle is None:
+        # Use a local variable, as MEMORY can reset self._handle at any time
+        handle = self._handle
+        if handle is None:
+            assert self._offset is not None
+            header = self._header
+            if header is not None and not isinstance(header, HeaderHandle):
+                # The header is already a handle on the whole message
+                handle = header
+            else:
+                handle = CodesReader.from_cache(self.path).at_offset(
+                    self._offset, self._length
+                )
+            self._handle = handle
+            self._header = None
+            MEMORY.forget(self._memory.pop("_header", None))
+            self._memory["_handle"] = MEMORY.add(self, "_handle", self._length or 0)
+        else:
+            MEMORY.touch(self._memory.get("_handle"))
+        return handle
+
+    @property
+    def header(self):
+        """Handle giving access to the metadata of the field. Unless the full
+        message is already loaded, only its headers are read, without the data section.
+        """
+        handle = self._handle
+        if handle is not None:
+            MEMORY.touch(self._memory.get("_handle"))
+            return handle
+
+        header = self._header
+        if header is None:
             assert self._offset is not None
-            self._handle = CodesReader.from_cache(self.path).at_offset(self._offset)
-        return self._handle
+            header = CodesReader.from_cache(self.path).at_offset(
+                self._offset, self._length, headers_only=True
+            )
+            self._header = header
+            if isinstance(header, HeaderHandle):
+                size = header.length
+            else:
+                size = self._length or 0
+            self._memory["_header"] = MEMORY.add(self, "_header", size)
+        else:
+            MEMORY.touch(self._memory.get("_header"))
+        return header
+
+    def _handle_for(self, name):
+        return self.handle if name in DATA_KEYS else self.header
 
     @property
     def values(self):
-        if self._values is None:
-            self._values = self.handle.get("values")
-        return self._values
+        values = self._values
+        if values is None:
+            values = self._decode_with_numpy()
+            if values is None:
+                values = self.handle.get("values")
+            self._values = values
+            self._memory["_values"] = MEMORY.add(self, "_values", values.nbytes)
+        else:
+            MEMORY.touch(self._memory.get("_values"))
+        return values
 
     @property
     def offset(self):
@@ -348,49 +777,67 @@ class GribField(Base):
 
     @property
     def shape(self):
-        Nj = missing_is_none(self.handle.get("Nj"))
-        Ni = missing_is_none(self.handle.get("Ni"))
+        Nj = missing_is_none(self.header.get("Nj"))
+        Ni = missing_is_none(self.header.get("Ni"))
         if Ni is None or Nj is None:
-            n = self.handle.get("numberOfDataPoints")
+            n = self.header.get("numberOfDataPoints")
             return (n,)  # shape must be a tuple
         return (Nj, Ni)
 
     def plot_map(self, backend):
         backend.bounding_box(
-            north=self.handle.get("latitudeOfFirstGridPointInDegrees"),
-            south=self.handle.get("latitudeOfLastGridPointInDegrees"),
-            west=self.handle.get("longitudeOfFirstGridPointInDegrees"),
-            east=self.handle.get("longitudeOfLastGridPointInDegrees"),
+            north=self.header.get("latitudeOfFirstGridPointInDegrees"),
+            south=self.header.get("latitudeOfLastGridPointInDegrees"),
+            west=self.header.get("longitudeOfFirstGridPointInDegrees"),
+            east=self.header.get("longitudeOfLastGridPointInDegrees"),
         )
-        backend.plot_grib(self.path, self.handle.get("offset"))
+        backend.plot_grib(self.path, self.offset)
+
+    def _decode_with_numpy(self, dtype=None):
+        # Returns None if not enabled, or if the packing is not supported
+        if not SETTINGS.get("use-numpy-grib-decoder"):
+            return None
+
+        import numpy as np
+
+        from .simple import decode_simple_packing
+
+        return decode_simple_packing(self, np.float64 if dtype is None else dtype)
 
     @call_counter
     def to_numpy(self, reshape=True, dtype=None):
-        values = self.values
+        values = None
+        if dtype is not None and self._values is None:
+            # Decode directly to the requested type, the values are not kept
+            values = self._decode_with_numpy(dtype)
+
+        if values is None:
+            values = self.values
+            if dtype is not None:
+                values = values.astype(dtype)
+
         if reshape:
             values = values.reshape(self.shape)
-        if dtype is not None:
-            values = values.astype(dtype)
         return values
 
     def __repr__(self):
         return "GribField(%s,%s,%s,%s,%s,%s)" % (
-            self.handle.get("shortName"),
-            self.handle.get("levelist"),
-            self.handle.get("date"),
-            self.handle.get("time"),
-            self.handle.get("step"),
-            self.handle.get("number"),
+            self.header.get("shortName"),
+            self.header.get("levelist"),
+            self.header.get("date"),
+            self.header.get("time"),
+            self.header.get("step"),
+            self.header.get("number"),
         )
 
     def _grid_definition(self):
         return dict(
-            north=self.handle.get("latitudeOfFirstGridPointInDegrees"),
-            south=self.handle.get("latitudeOfLastGridPointInDegrees"),
-            west=self.handle.get("longitudeOfFirstGridPointInDegrees"),
-            east=self.handle.get("longitudeOfLastGridPointInDegrees"),
-            south_north_increment=self.handle.get("jDirectionIncrementInDegrees"),
-            west_east_increment=self.handle.get("iDirectionIncrementInDegrees"),
+            north=self.header.get("latitudeOfFirstGridPointInDegrees"),
+            south=self.header.get("latitudeOfLastGridPointInDegrees"),
+            west=self.header.get("longitudeOfFirstGridPointInDegrees"),
+            east=self.header.get("longitudeOfLastGridPointInDegrees"),
+            south_north_increment=self.header.get("jDirectionIncrementInDegrees"),
+            west_east_increment=self.header.get("iDirectionIncrementInDegrees"),
         )
 
     def field_metadata(self):
@@ -412,15 +859,15 @@ class GribField(Base):
             "standard_name",
             "levelist",
         ):
-            p = self.handle.get(n)
+            p = self.header.get(n)
             if p is not None:
                 m[n] = str(p)
         m["shape"] = self.shape
         return m
 
     def datetime(self):
-        date = self.handle.get("date")
-        time = self.handle.get("time")
+        date = self.header.get("date")
+        time = self.header.get("time")
         return datetime.datetime(
             date // 10000,
             date % 10000 // 100,
@@ -430,7 +877,7 @@ class GribField(Base):
         )
 
     def valid_datetime(self):
-        step = self.handle.get("endStep")
+        step = self.header.get("endStep")
         return self.datetime() + datetime.timedelta(hours=step)
 
     def to_datetime_list(self):
@@ -438,16 +885,16 @@ class GribField(Base):
 
     def to_bounding_box(self):
         return BoundingBox(
-            north=self.handle.get("latitudeOfFirstGridPointInDegrees"),
-            south=self.handle.get("latitudeOfLastGridPointInDegrees"),
-            west=self.handle.get("longitudeOfFirstGridPointInDegrees"),
-            east=self.handle.get("longitudeOfLastGridPointInDegrees"),
+            north=self.header.get("latitudeOfFirstGridPointInDegrees"),
+            south=self.header.get("latitudeOfLastGridPointInDegrees"),
+            west=self.header.get("longitudeOfFirstGridPointInDegrees"),
+            east=self.header.get("longitudeOfLastGridPointInDegrees"),
         )
 
     def _attributes(self, names):
         result = {}
         for name in names:
-            result[name] = self.handle.get(name)
+            result[name] = self._handle_for(name).get(name)
         return result
 
     def _get(self, name):
@@ -456,7 +903,7 @@ class GribField(Base):
         # additional '.128' (in climetlab/scripts/grib.py)
         if name == "param":
             name = "paramId"
-        return self.handle.get(name)
+        return self._handle_for(name).get(name)
 
     def metadata(self, name):
         if name == DATETIME:
@@ -481,18 +928,29 @@ class GribField(Base):
 
         return self[name]
 
+    def prefetch_metadata(self, names):
+        keys = []
+        for name in names:
+            for key in METADATA_KEYS.get(name, (name,)):
+                if key not in self._cache and ":" not in key:
+                    keys.append(key)
+
+        if keys:
+            self._cache.update(self.header.get_many(keys))
+
     def __getitem__(self, name):
         """For cfgrib"""
 
         if name not in self._cache:
-            proc = self.handle.get
+            handle = self._handle_for(name)
+            proc = handle.get
             if ":" in name:
                 try:
                     name, kind = name.split(":")
                     proc = dict(
-                        str=self.handle.get_string,
-                        int=self.handle.get_long,
-                        float=self.handle.get_double,
+                        str=handle.get_string,
+                        int=handle.get_long,
+                        float=handle.get_double,
                     )[kind]
                 except Exception:
                     LOG.exception(f"Unsupported kind '{kind}'")
@@ -507,10 +965,15 @@ class GribField(Base):
         return self.handle.get_data()
 
     def as_mars(self, param="shortName"):
-        return self.handle.as_mars(param)
+        return self.header.as_mars(param)
 
     def write(self, f):
-        f.write(self.handle.read_bytes(self._offset, self._length))
+        if self._length is None:
+            self.handle.write(f)
+            return
+        f.write(
+            CodesReader.from_cache(self.path).read_bytes(self._offset, self._length)
+        )
 
     def plot_numpy(self, backend, array):
         if self.handle.get("gridType") == "regular_ll":
@@ -537,14 +1000,13 @@ class GribField(Base):
         GribField(tmp, 0, self._length).plot_map(backend)
 
     def iterate_grid_points(self):
-        latlon = self.handle.get("latitudeLongitudeValues")
-        yield from zip(islice(latlon, 0, None, 3), islice(latlon, 1, None, 3))
+        lat, lon = self.grid_points()
+        yield from zip(lat.tolist(), lon.tolist())
 
     def grid_points(self):
-        import numpy as np
-
-        data = self.data
-        lat = np.array([d["lat"] for d in data])
-        lon = np.array([d["lon"] for d in data])
+        """Returns the latitudes and longitudes of the field as read-only arrays,
+        shared by all the fields on the same grid.
+        """
+        from .geometry import GEOMETRY
 
-        return lat, lon
+        return GEOMETRY.grid_points(self)
@@ -7,13 +7,17 @@
 # nor does it submit to any jurisdiction.
 #
 
-import json
+import datetime
 import logging
 from collections import defaultdict
 
-from climetlab.core.caching import auxiliary_cache_file
+from climetlab.core.constants import DATETIME
+from climetlab.core.index import fields_to_numpy
+from climetlab.core.table import compact
 from climetlab.utils.bbox import BoundingBox
+from climetlab.utils.parts import Part, copy_parts
 
+from .codes import GribField
 from .pandas import PandasMixIn
 from .pytorch import PytorchMixIn
 from .tensorflow import TensorflowMixIn
@@ -24,12 +28,14 @@ LOG = logging.getLogger(__name__)
 
 class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
     _statistics = None
+    _coords = None
 
     def _find_all_coords_dict(self):
         from climetlab.indexing.database import GRIB_KEYS_NAMES
 
         coords = defaultdict(set)
         for f in self:
+            f.prefetch_metadata(GRIB_KEYS_NAMES)
             for k in GRIB_KEYS_NAMES:
                 v = f.metadata(k)
                 if v is None:
@@ -58,10 +64,17 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
 
         return mv_read(self.path)
 
-    def to_numpy(self, **kwargs):
-        import numpy as np
+    def to_numpy(self, parallel=False, max_workers=None, **kwargs):
+        """Returns the values of the fields as a single array. With `parallel`
+        set to "threads" (or True) or "processes", the fields are decoded
+        concurrently by `max_workers` workers (one per CPU by default).
+        """
+        if parallel:
+            from .parallel import decode_fields
 
-        return np.array([f.to_numpy(**kwargs) for f in self])
+            return decode_fields(self, parallel, max_workers=max_workers, **kwargs)
+
+        return fields_to_numpy(self, **kwargs)
 
     def plot_map(self, backend):
         return self.first.plot_map(backend)
@@ -73,7 +86,11 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
         return times[0]
 
     def to_datetime_list(self):
-        # TODO: check if that can be done faster
+        table = self._metadata_table()
+        if table is not None and len(table):
+            _, values = compact(*table.load([DATETIME])[0])
+            return sorted(set(datetime.datetime.fromisoformat(v) for v in values))
+
         result = set()
         for s in self:
             result.add(s.valid_datetime())
@@ -82,67 +99,17 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
     def to_bounding_box(self):
         return BoundingBox.multi_merge([s.to_bounding_box() for s in self])
 
-    def statistics(self):
-        import numpy as np
-
-        if self._statistics is not None:
-            return self._statistics
+    def statistics(self, parallel=False, max_workers=None):
+        """Returns the minimum, maximum, average and standard deviation of the values
+        of all the fields, ignoring missing values. The results are kept in the cache,
+        so they are only computed once for the same selection of messages.
+        """
+        if self._statistics is None:
+            from .statistics import fields_statistics
 
-        if False:
-            cache = auxiliary_cache_file(
-                "grib-statistics--",
-                self.path,
-                content="null",
-                extension=".json",
+            self._statistics = fields_statistics(
+                self, parallel=parallel, max_workers=max_workers
             )
-
-            with open(cache) as f:
-                self._statistics = json.load(f)
-
-            if self._statistics is not None:
-                return self._statistics
-
-        stdev = None
-        average = None
-        maximum = None
-        minimum = None
-        count = 0
-
-        for s in self:
-            v = s.values
-            if count:
-                stdev = np.add(stdev, np.multiply(v, v))
-                average = np.add(average, v)
-                maximum = np.maximum(maximum, v)
-                minimum = np.minimum(minimum, v)
-            else:
-                stdev = np.multiply(v, v)
-                average = v
-                maximum = v
-                minimum = v
-
-            count += 1
-
-        nans = np.count_nonzero(np.isnan(average))
-        assert nans == 0, "Statistics with missing values not yet implemented"
-
-        maximum = np.amax(maximum)
-        minimum = np.amin(minimum)
-        average = np.mean(average) / count
-        stdev = np.sqrt(np.mean(stdev) / count - average * average)
-
-        self._statistics = dict(
-            minimum=minimum,
-            maximum=maximum,
-            average=average,
-            stdev=stdev,
-            count=count,
-        )
-
-        if False:
-            with open(cache, "w") as f:
-                json.dump(self._statistics, f)
-
         return self._statistics
 
     def save(self, filename):
@@ -150,5 +117,17 @@ class FieldSetMixin(PandasMixIn, XarrayMixIn, PytorchMixIn, TensorflowMixIn):
             self.write(f)
 
     def write(self, f):
+        # Messages read from files are copied as byte ranges, adjacent messages
+        # of the same file at once. The other fields are written one by one.
+        parts = []
         for s in self:
+            if isinstance(s, GribField) and s._length is not None:
+                parts.append(Part(s.path, s._offset, s._length))
+                continue
+            if parts:
+                copy_parts(parts, f)
+                parts = []
             s.write(f)
+
+        if parts:
+            copy_parts(parts, f)
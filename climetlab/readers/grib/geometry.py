@@ -0,0 +1,89 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from climetlab.core.caching import cache_file
+from climetlab.core.settings import SETTINGS
+
+LOG = logging.getLogger(__name__)
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class GeometryCache:
+    """Latitudes and longitudes of the most recently used grids, keyed by
+    the `md5GridSection` of the fields, so that all the fields on the same grid
+    share the same read-only arrays.
+    """
+
+    def __init__(self, size=16):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def grid_points(self, field):
+        # Only the headers of the field are needed to find its grid
+        key = field.header.get("md5GridSection")
+        if key is None:
+            return tuple(_read_only(a) for a in field.handle.get_latitudes_longitudes())
+
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        self.misses += 1
+        if SETTINGS.get("cache-grib-geometry"):
+            lat, lon = self._load(key, field.handle)
+        else:
+            lat, lon = (_read_only(a) for a in field.handle.get_latitudes_longitudes())
+
+        with self.lock:
+            self.entries[key] = (lat, lon)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return lat, lon
+
+    def _load(self, key, handle):
+        def create(target, args):
+            with open(target, "wb") as f:
+                np.save(f, np.stack(handle.get_latitudes_longitudes()))
+
+        path = cache_file("grib-geometry", create, key, extension=".npy")
+
+        # Memory-mapped in read-only mode
+        latlon = np.load(path, mmap_mode="r")
+        return latlon[0], latlon[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(self.entries),
+            size=self.size,
+        )
+
+
+GEOMETRY = GeometryCache()
@@ -0,0 +1,409 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+"""Parsing of the headers of GRIB messages in Python, to index large numbers of
+messages without creating an eccodes handle for each of them.
+
+Most MARS keys (param, levtype, class, stream, expver...) are derived by eccodes
+from its tables, but they only depend on the headers of the message. Messages
+whose headers only differ by their date, time, step, level and ensemble number
+share the same "template". The first message of each template is decoded by
+eccodes, and its keys are reused for the next messages of the same template,
+updating only the keys that vary, which are read from the bytes. These keys are
+checked against eccodes on the first message of each template: if they do not
+match, all the messages of that template are decoded by eccodes.
+"""
+
+import datetime
+import logging
+import math
+import struct
+
+import numpy as np
+
+from .simple import apply_bitmap, unpack_values
+
+LOG = logging.getLogger(__name__)
+
+DATETIME = "datetime"
+
+# Number of missing value used by eccodes
+MISSING_VALUE = 9999
+
+# GRIB1 types of levels where 'levelist' is the 2 bytes level
+GRIB1_LEVEL_TYPES = {100, 103, 105, 107, 109, 111, 113, 115, 117, 119, 125, 160}
+
+# GRIB2 types of fixed surface where 'levelist' is the value of the first surface,
+# with the factor applied by eccodes
+GRIB2_LEVEL_TYPES = {
+    100: 100,  # Pa, hPa in MARS
+    102: 1,
+    103: 1,
+    104: 1,
+    105: 1,
+    106: 1,
+    107: 1,
+    108: 100,
+    109: 1,
+    150: 1,
+    151: 1,
+    160: 1,
+}
+
+
+def _uint(b, i, n):
+    return int.from_bytes(b[i : i + n], "big")
+
+
+def _int(b, i, n):
+    # GRIB signed integers: the first bit is the sign
+    value = _uint(b, i, n)
+    sign = 1 << (8 * n - 1)
+    if value & sign:
+        return -(value & (sign - 1))
+    return value
+
+
+def _ibm_float(b, i):
+    sign = -1 if b[i] & 0x80 else 1
+    exponent = b[i] & 0x7F
+    mantissa = _uint(b, i + 1, 3)
+    return sign * math.ldexp(mantissa, 4 * (exponent - 64) - 24)
+
+
+def _masked(b, ranges):
+    result = bytearray(b)
+    for start, end in ranges:
+        result[start:end] = bytes(end - start)
+    return bytes(result)
+
+
+class Headers:
+    """The template and the varying keys of a message"""
+
+    def __init__(self, template, keys, packing=None):
+        self.template = template
+        self.keys = keys
+        # Position and parameters of the data, for simple packing
+        self.packing = packing
+
+
+def _grib1(m):
+    length = _uint(m, 8, 3)
+    s1 = m[8 : 8 + length]
+    if length < 28:
+        return None
+
+    keys = dict(
+        date=((s1[24] - 1) * 100 + s1[12]) * 10000 + s1[13] * 100 + s1[14],
+        time=s1[15] * 100 + s1[16],
+    )
+    masked = [(12, 17), (24, 25)]
+
+    # Only hours are supported, otherwise the step is part of the template
+    unit, p1, p2, indicator = s1[17], s1[18], s1[19], s1[20]
+    if unit == 1 and indicator in (0, 1):
+        keys["step"] = p1
+        masked.append((18, 19))
+    elif unit == 1 and indicator == 10:
+        keys["step"] = p1 * 256 + p2
+        masked.append((18, 20))
+
+    if s1[9] in GRIB1_LEVEL_TYPES:
+        keys["levelist"] = _uint(s1, 10, 2)
+        masked.append((10, 12))
+
+    # ECMWF local definition 1
+    if s1[4] == 98 and length >= 51 and s1[40] == 1:
+        keys["number"] = s1[49]
+        masked.append((49, 50))
+
+    offset = 8 + length
+    flag = s1[7]
+
+    grid = b""
+    if flag & 0x80:
+        grid = m[offset : offset + _uint(m, offset, 3)]
+        offset += len(grid)
+
+    bitmap = None
+    if flag & 0x40:
+        n = _uint(m, offset, 3)
+        if _uint(m, offset + 4, 2) == 0:
+            unused = m[offset + 3]
+            bitmap = (offset + 6, (n - 6) * 8 - unused)
+        offset += n
+
+    template = (1, _masked(s1, masked), bytes(grid))
+
+    packing = None
+    n = _uint(m, offset, 3)
+    flags = m[offset + 3]
+    bits_per_value = m[offset + 10]
+    if flags & 0xF0 == 0 and bits_per_value > 0 and (flag & 0x40 == 0 or bitmap):
+        available = (n - 11) * 8 - (flags & 0x0F)
+        count = available // bits_per_value
+        if bitmap is not None or available % bits_per_value == 0:
+            packing = dict(
+                data=(offset + 11, n - 11),
+                bitmap=bitmap,
+                count=None if bitmap else count,
+                bits_per_value=bits_per_value,
+                reference_value=_ibm_float(m, offset + 6),
+                binary_scale_factor=_int(m, offset + 4, 2),
+                decimal_scale_factor=_int(s1, 26, 2),
+            )
+
+    return Headers(template, keys, packing)
+
+
+def _grib2(m):
+    total = _uint(m, 8, 8)
+
+    sections = {}
+    offset = 16
+    while offset < total - 4:
+        length = _uint(m, offset, 4)
+        number = m[offset + 4]
+        if number in sections or length < 5:
+            # Several fields in the same message are not supported
+            return None
+        sections[number] = (offset, length)
+        offset += length
+
+    if any(n not in sections for n in (1, 3, 4, 5, 7)):
+        return None
+
+    def section(n):
+        offset, length = sections[n]
+        return m[offset : offset + length]
+
+    s1 = section(1)
+    keys = dict(
+        date=_uint(s1, 12, 2) * 10000 + s1[14] * 100 + s1[15],
+        time=s1[16] * 100 + s1[17],
+    )
+    s1 = _masked(s1, [(12, 18)])
+
+    s4 = section(4)
+    masked = []
+    if _uint(s4, 7, 2) in (0, 1):
+        if s4[17] == 1:  # Hours
+            keys["step"] = _uint(s4, 18, 4)
+            masked.append((18, 22))
+
+        factor = GRIB2_LEVEL_TYPES.get(s4[22])
+        scale, value = _int(s4, 23, 1), _uint(s4, 24, 4)
+        if factor is not None and s4[23] != 255 and value != 0xFFFFFFFF:
+            # Only integer levels, e.g. 50000 Pa is 500 hPa
+            numerator, denominator = value, factor
+            if scale >= 0:
+                denominator *= 10**scale
+            else:
+                numerator *= 10**-scale
+            if numerator % denominator == 0:
+                keys["levelist"] = numerator // denominator
+                masked.append((23, 28))
+
+        if _uint(s4, 7, 2) == 1:
+            keys["number"] = s4[35]
+            masked.append((35, 36))
+
+    template = (
+        2,
+        m[6],  # Discipline
+        s1,
+        bytes(section(2)) if 2 in sections else b"",
+        bytes(section(3)),
+        _masked(s4, masked),
+    )
+
+    packing = None
+    s5 = section(5)
+    if _uint(s5, 9, 2) == 0 and s5[19] > 0:
+        bitmap = None
+        if 6 in sections:
+            s6 = section(6)
+            if s6[5] == 0:
+                bitmap = (sections[6][0] + 6, _uint(section(3), 6, 4))
+            elif s6[5] != 255:
+                return Headers(template, keys)
+
+        count = _uint(s5, 5, 4)
+        if bitmap is None and count != _uint(section(3), 6, 4):
+            return Headers(template, keys)
+
+        data_offset, data_length = sections[7]
+        packing = dict(
+            data=(data_offset + 5, data_length - 5),
+            bitmap=bitmap,
+            count=count,
+            bits_per_value=s5[19],
+            reference_value=struct.unpack(">f", s5[11:15])[0],
+            binary_scale_factor=_int(s5, 15, 2),
+            decimal_scale_factor=_int(s5, 17, 2),
+        )
+
+    return Headers(template, keys, packing)
+
+
+def parse_headers(message):
+    """Returns the headers of the GRIB `message` (a bytes-like object),
+    or None if they are not supported.
+    """
+    if len(message) < 16 or message[:4] != b"GRIB":
+        return None
+
+    try:
+        edition = message[7]
+        if edition == 1:
+            return _grib1(message)
+        if edition == 2:
+            return _grib2(message)
+    except (IndexError, struct.error, ValueError):
+        LOG.debug("Cannot parse GRIB headers", exc_info=True)
+    return None
+
+
+def decode_values(message, headers):
+    """Returns the values of a message packed with simple packing, or None"""
+    packing = headers.packing
+    if packing is None:
+        return None
+
+    offset, length = packing["data"]
+    data = message[offset : offset + length]
+
+    bitmap = packing["bitmap"]
+    count = packing["count"]
+    if bitmap is not None:
+        bitmap_offset, points = bitmap
+        bitmap = message[bitmap_offset : bitmap_offset + (points + 7) // 8]
+        bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=points)
+        count = int(np.count_nonzero(bits))
+
+    if count * packing["bits_per_value"] > length * 8:
+        return None
+
+    values = unpack_values(
+        data,
+        packing["bits_per_value"],
+        count,
+        packing["reference_value"],
+        packing["binary_scale_factor"],
+        packing["decimal_scale_factor"],
+    )
+
+    if bitmap is None:
+        return values
+
+    return apply_bitmap(values, bitmap, points, MISSING_VALUE)
+
+
+def _reference_datetime(keys):
+    date, time = keys["date"], keys["time"]
+    return datetime.datetime(
+        date // 10000,
+        date % 10000 // 100,
+        date % 100,
+        time // 100,
+        time % 100,
+    )
+
+
+class Template:
+    """The keys decoded by eccodes for the first message of a template"""
+
+    def __init__(self, headers, field):
+        self.field = dict(field)
+
+        # The keys read from the headers must be the same as the ones of eccodes
+        self.keys = [k for k in headers.keys if k in field]
+        for k in self.keys:
+            expected, value = field[k], headers.keys[k]
+            if value != expected or type(value) is not type(expected):
+                raise ValueError(f"{k}: {value!r} != {expected!r}")
+
+        # Keys that vary in the headers but are not in the MARS keys may still
+        # be used by eccodes to derive other keys (e.g. the level of '2t' in
+        # GRIB2), so these templates are only used for the same values
+        self.exact = [k for k in headers.keys if k not in field]
+
+        self.offset = None
+        if DATETIME in field:
+            self.offset = field[DATETIME] - self._valid_datetime(headers)
+
+    def _valid_datetime(self, headers, offset=datetime.timedelta(0)):
+        step = headers.keys["step"] if "step" in self.keys else 0
+        return (
+            _reference_datetime(headers.keys) + datetime.timedelta(hours=step) + offset
+        )
+
+    def __call__(self, headers):
+        field = dict(self.field)
+        for k in self.keys:
+            field[k] = headers.keys[k]
+        if self.offset is not None:
+            field[DATETIME] = self._valid_datetime(headers, self.offset)
+        return field
+
+
+class HeadersParser:
+    """Returns the keys of GRIB messages, using `decode(message)` to get
+    the keys of the first message of each template from eccodes.
+    """
+
+    def __init__(self, decode):
+        self.decode = decode
+        self.exact = {}
+        self.templates = {}
+        self.parsed = 0
+        self.decoded = 0
+
+    def _decode(self, message):
+        self.decoded += 1
+        return self.decode(message)
+
+    def parse(self, message):
+        """Returns the keys of `message` and its headers (None if not supported)"""
+        headers = parse_headers(message)
+        if headers is None:
+            return self._decode(message), None
+
+        signature = (headers.template, tuple(headers.keys))
+        exact = self.exact.get(signature)
+
+        if exact is False:
+            return self._decode(message), headers
+
+        if exact is not None:
+            template = self.templates.get(
+                (signature, tuple(headers.keys[k] for k in exact))
+            )
+            if template is not None:
+                self.parsed += 1
+                return template(headers), headers
+
+        field = self._decode(message)
+
+        try:
+            template = Template(headers, field)
+        except ValueError as e:
+            LOG.debug("Using eccodes for GRIB template: %s", e)
+            self.exact[signature] = False
+            return field, headers
+
+        if exact is not None and exact != template.exact:
+            self.exact[signature] = False
+            return field, headers
+
+        self.exact[signature] = template.exact
+        key = tuple(headers.keys[k] for k in template.exact)
+        self.templates[(signature, key)] = template
+        return field, headers
@@ -13,6 +13,7 @@ import os
 from abc import abstractmethod
 
 from climetlab.core.index import Index, MaskIndex, MultiIndex
+from climetlab.core.table import MetadataTable
 from climetlab.decorators import normalize_grib_key_values, normalize_grib_keys
 from climetlab.indexing.database import (
     FILEPARTS_KEY_NAMES,
@@ -167,6 +168,12 @@ class FieldSetInFiles(FieldSet):
         part = self.part(n)
         return GribField(part.path, part.offset, part.length)
 
+    def _metadata_table(self):
+        # Built lazily, one column per key used to select or order the fields
+        if self._table is None:
+            self._table = MetadataTable.from_elements(self)
+        return self._table
+
     def __len__(self):
         return self.number_of_parts()
 
@@ -11,17 +11,169 @@
 import json
 import logging
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from climetlab.core.caching import auxiliary_cache_file
-from climetlab.readers.grib.codes import get_messages_positions
+import numpy as np
+
+from climetlab.core.caching import auxiliary_cache_file, auxiliary_cache_file_path
+from climetlab.core.settings import SETTINGS
+from climetlab.core.table import MetadataTable
+from climetlab.readers.grib.codes import scan_messages_positions
 from climetlab.readers.grib.index import FieldSetInFiles
 from climetlab.utils.parts import Part
 
 LOG = logging.getLogger(__name__)
 
+# Binary offsets index: an 8 bytes magic, the format version and the
+# number of messages (both as little-endian int64), followed by the offsets
+# then the lengths of the messages, as little-endian int64 arrays.
+INDEX_MAGIC = b"CMLGRIBI"
+INDEX_VERSION = 1
+INDEX_DTYPE = np.dtype("<i8")
+INDEX_HEADER_SIZE = len(INDEX_MAGIC) + 2 * INDEX_DTYPE.itemsize
+
+
+def write_positions_index(path, offsets, lengths):
+    assert len(offsets) == len(lengths), (len(offsets), len(lengths))
+    with open(path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(np.array([INDEX_VERSION, len(offsets)], dtype=INDEX_DTYPE).tobytes())
+        f.write(np.asarray(offsets, dtype=INDEX_DTYPE).tobytes())
+        f.write(np.asarray(lengths, dtype=INDEX_DTYPE).tobytes())
+
+
+def read_positions_index(path):
+    """Returns the offsets and lengths stored in `path` as memory-mapped arrays,
+    or None if the file is not a valid index.
+    """
+    size = os.path.getsize(path)
+    if size < INDEX_HEADER_SIZE:
+        return None
+
+    with open(path, "rb") as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            return None
+        version, count = np.frombuffer(f.read(2 * INDEX_DTYPE.itemsize), INDEX_DTYPE)
+
+    if version != INDEX_VERSION:
+        LOG.warning("Ignoring %s, version %s is not supported", path, version)
+        return None
+
+    count = int(count)
+    if size != INDEX_HEADER_SIZE + 2 * count * INDEX_DTYPE.itemsize:
+        LOG.warning("Ignoring %s, invalid size", path)
+        return None
+
+    if count == 0:
+        empty = np.zeros(0, dtype=INDEX_DTYPE)
+        return empty, empty
+
+    array = np.memmap(
+        path,
+        dtype=INDEX_DTYPE,
+        mode="r",
+        offset=INDEX_HEADER_SIZE,
+        shape=(2 * count,),
+    )
+    return array[:count], array[count:]
+
+
+# Metadata sidecar: a NumPy .npz file with, for each key, the codes of the
+# values of the messages (see MetadataTable), and a JSON header with the
+# distinct values of each key. Keys are added when they are first used.
+METADATA_VERSION = 1
+METADATA_HEADER = "__header__"
+
+
+def _json_values(values):
+    return all(v is None or isinstance(v, (str, int, float)) for v in values)
+
+
+def write_metadata_sidecar(path, count, columns):
+    """Writes the `columns` of a MetadataTable of `count` messages to `path`.
+    Columns with values that cannot be stored in JSON are ignored.
+    """
+    arrays = {}
+    values = {}
+    for name, (codes, v) in columns.items():
+        if name == METADATA_HEADER or not _json_values(v):
+            continue
+        dtype = np.uint8 if len(v) <= 0x100 else np.uint16
+        if len(v) > 0x10000:
+            dtype = np.uint32
+        arrays[name] = np.asarray(codes).astype(dtype)
+        values[name] = v
+
+    header = dict(version=METADATA_VERSION, count=count, values=values)
+    arrays[METADATA_HEADER] = np.array(json.dumps(header))
+
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def read_metadata_sidecar(path, count):
+    """Returns the columns stored in `path`, or None if the file is not
+    a valid sidecar for `count` messages.
+    """
+    with np.load(path) as f:
+        header = json.loads(str(f[METADATA_HEADER]))
+        if header["version"] != METADATA_VERSION or header["count"] != count:
+            return None
+        return {
+            name: (f[name].astype(np.int64), values)
+            for name, values in header["values"].items()
+        }
+
+
+def metadata_sidecar_path(path):
+    return auxiliary_cache_file_path("grib-metadata", path, extension=".npz")
+
+
+def positions_index_path(path):
+    return auxiliary_cache_file_path("grib-index", path, extension=".index")
+
+
+def build_positions_indexes(paths, max_workers=None):
+    """Create the missing offsets indexes of the GRIB files `paths`,
+    scanning the files concurrently in a pool of at most `max_workers` workers.
+    """
+    todo = [p for p in paths if not os.path.exists(positions_index_path(p))]
+    if not todo:
+        return
+
+    if max_workers is None:
+        max_workers = SETTINGS.get("number-of-grib-scanning-workers")
+    if max_workers <= 0:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(todo))
+
+    if max_workers == 1:
+        results = map(scan_messages_positions, todo)
+    else:
+        # Deactivate multiprocessing for windows
+        executor = (
+            ThreadPoolExecutor if sys.platform == "win32" else ProcessPoolExecutor
+        )
+        with executor(max_workers=max_workers) as pool:
+            results = list(
+                pool.map(
+                    scan_messages_positions,
+                    todo,
+                    chunksize=max(1, len(todo) // (max_workers * 4)),
+                )
+            )
+
+    for path, positions in zip(todo, results):
+
+        def create(target, args, positions=positions):
+            write_positions_index(target, *positions)
+
+        auxiliary_cache_file("grib-index", path, extension=".index", create=create)
+
 
 class FieldSetInOneFile(FieldSetInFiles):
-    VERSION = 1
+    VERSION = 1  # Version of the legacy JSON index
 
     @property
     def availability_path(self):
@@ -33,11 +185,12 @@ class FieldSetInOneFile(FieldSetInFiles):
         self.path = path
         self.offsets = None
         self.lengths = None
+
         self.mappings_cache_file = auxiliary_cache_file(
             "grib-index",
             path,
-            content="null",
-            extension=".json",
+            extension=".index",
+            create=self._create_cache,
         )
 
         if not self._load_cache():
@@ -45,51 +198,117 @@ class FieldSetInOneFile(FieldSetInFiles):
 
         super().__init__(**kwargs)
 
-    def _build_offsets_lengths_mapping(self):
-        offsets = []
-        lengths = []
-
-        for offset, length in get_messages_positions(self.path):
-            offsets.append(offset)
-            lengths.append(length)
+    @classmethod
+    def from_paths(cls, paths, max_workers=None, **kwargs):
+        """Create one fieldset per path, in the same order as `paths`,
+        scanning the files concurrently beforehand.
+        """
+        paths = list(paths)
+        build_positions_indexes(paths, max_workers=max_workers)
+        return [cls(path, **kwargs) for path in paths]
 
-        self.offsets = offsets
-        self.lengths = lengths
+    def _create_cache(self, target, args):
+        positions = self._load_json_cache()
+        if positions is None:
+            positions = scan_messages_positions(self.path)
+        write_positions_index(target, *positions)
 
+    def _build_offsets_lengths_mapping(self):
+        self.offsets, self.lengths = scan_messages_positions(self.path)
         self._save_cache()
 
     def _save_cache(self):
         try:
-            with open(self.mappings_cache_file, "w") as f:
-                json.dump(
-                    dict(
-                        version=self.VERSION,
-                        offsets=self.offsets,
-                        lengths=self.lengths,
-                    ),
-                    f,
-                )
+            write_positions_index(self.mappings_cache_file, self.offsets, self.lengths)
         except Exception:
             LOG.exception("Write to cache failed %s", self.mappings_cache_file)
 
     def _load_cache(self):
         try:
-            with open(self.mappings_cache_file) as f:
+            positions = read_positions_index(self.mappings_cache_file)
+            if positions is None:
+                return False
+
+            self.offsets, self.lengths = positions
+            return True
+        except Exception:
+            LOG.exception("Load from cache failed %s", self.mappings_cache_file)
+
+        return False
+
+    def _load_json_cache(self):
+        # Indexes created by previous versions of climetlab
+        path = auxiliary_cache_file_path("grib-index", self.path, extension=".json")
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
                 c = json.load(f)
                 if not isinstance(c, dict):
-                    return False
+                    return None
 
                 assert c["version"] == self.VERSION
-                self.offsets = c["offsets"]
-                self.lengths = c["lengths"]
-                return True
+                return (
+                    np.array(c["offsets"], dtype=INDEX_DTYPE),
+                    np.array(c["lengths"], dtype=INDEX_DTYPE),
+                )
         except Exception:
-            LOG.exception("Load from cache failed %s", self.mappings_cache_file)
+            LOG.exception("Load from cache failed %s", path)
 
-        return False
+        return None
 
     def part(self, n):
-        return Part(self.path, self.offsets[n], self.lengths[n])
+        return Part(self.path, int(self.offsets[n]), int(self.lengths[n]))
+
+    def _metadata_table(self):
+        if self._table is None:
+            self._table = MetadataTable(len(self), self._metadata_columns)
+            # The columns in the sidecar are loaded, so they are
+            # shared with the tables of the subsets of the file
+            self._table.columns.update(self._load_metadata_sidecar())
+        return self._table
+
+    def _load_metadata_sidecar(self):
+        path = metadata_sidecar_path(self.path)
+        if not os.path.exists(path):
+            return {}
+        try:
+            return read_metadata_sidecar(path, len(self)) or {}
+        except Exception:
+            LOG.exception("Load from cache failed %s", path)
+            return {}
+
+    def _save_metadata_sidecar(self, columns):
+        def create(target, args):
+            write_metadata_sidecar(target, len(self), columns)
+
+        try:
+            path = metadata_sidecar_path(self.path)
+            if os.path.exists(path):
+                # Columns added to an existing sidecar
+                tmp = f"{path}.{os.getpid()}.tmp"
+                write_metadata_sidecar(tmp, len(self), columns)
+                os.replace(tmp, path)
+            else:
+                auxiliary_cache_file(
+                    "grib-metadata", self.path, extension=".npz", create=create
+                )
+        except Exception:
+            LOG.exception("Write to cache failed for the metadata of %s", self.path)
+
+    def _metadata_columns(self, names):
+        # Only the keys used are read from the messages, and added to the
+        # sidecar file for the next sessions and processes
+        columns = MetadataTable.from_elements(self).build(names)
+
+        # Another process may have added other keys in the meantime
+        stored = self._load_metadata_sidecar()
+        stored.update(self._table.columns)
+        stored.update(columns)
+        self._save_metadata_sidecar(stored)
+
+        return columns
 
     def number_of_parts(self):
         return len(self.offsets)
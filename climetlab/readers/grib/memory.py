@@ -0,0 +1,151 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from climetlab.core.settings import SETTINGS
+
+LOG = logging.getLogger(__name__)
+
+NONE = object()
+
+
+class MemoryEntry(weakref.ref):
+    """Weak reference to an object holding `size` bytes in its attribute `attribute`"""
+
+    __slots__ = ("attribute", "size")
+
+    # Entries are compared by identity, not by referent
+    __hash__ = object.__hash__
+
+    def __eq__(self, other):
+        return self is other
+
+
+class FieldsMemory:
+    """Keeps track of the memory used by the decoded values and the eccodes
+    handles of all the GRIB fields of the process. When the total exceeds the
+    'maximum-grib-fields-memory' setting, the least recently used ones are
+    released. They are decoded again the next time they are accessed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.collected = []
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._budget = NONE
+
+    @property
+    def budget(self):
+        if self._budget is NONE:
+            self._budget = SETTINGS.get("maximum-grib-fields-memory")
+        return self._budget
+
+    def settings_changed(self):
+        # The new budget is applied on the next call to add()
+        self._budget = NONE
+
+    def add(self, obj, attribute, size):
+        """Record that `obj` has just decoded `size` bytes in `attribute`.
+        Returns an entry to be passed to :py:meth:`touch` on later accesses,
+        or None if the memory is not limited. Nothing is counted in that case.
+        """
+        if self.budget is None:
+            return None
+
+        entry = MemoryEntry(obj, self.collected.append)
+        entry.attribute = attribute
+        entry.size = size
+
+        with self.lock:
+            self.misses += 1
+            self.entries[entry] = None
+            self.size += size
+            self._release(keep=entry)
+
+        return entry
+
+    def touch(self, entry):
+        if entry is None:
+            return
+
+        with self.lock:
+            self.hits += 1
+            if entry in self.entries:
+                self.entries.move_to_end(entry)
+
+    def forget(self, entry):
+        """Stop counting the memory of `entry`, e.g. when its attribute is replaced"""
+        if entry is None:
+            return
+
+        with self.lock:
+            self._forget(entry)
+
+    def _forget(self, entry):
+        if self.entries.pop(entry, NONE) is not NONE:
+            self.size -= entry.size
+
+    def _release(self, keep=None):
+        # Objects that have been garbage collected
+        while self.collected:
+            self._forget(self.collected.pop())
+
+        budget = self.budget
+        if budget is None:
+            return
+
+        while self.size > budget and self.entries:
+            entry = next(iter(self.entries))
+            if entry is keep:
+                break
+
+            self._forget(entry)
+
+            obj = entry()
+            if obj is not None:
+                setattr(obj, entry.attribute, None)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            while self.entries:
+                entry, _ = self.entries.popitem(last=False)
+                obj = entry()
+                if obj is not None:
+                    setattr(obj, entry.attribute, None)
+            self.size = 0
+
+    def statistics(self):
+        with self.lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=self.size,
+                entries=len(self.entries),
+                budget=self.budget,
+            )
+
+    def __repr__(self):
+        return "FieldsMemory(%s)" % (
+            ",".join(f"{k}={v}" for k, v in self.statistics().items()),
+        )
+
+
+MEMORY = FieldsMemory()
+
+SETTINGS.on_change(MEMORY.settings_changed)
@@ -9,29 +9,100 @@
 
 import logging
 
+import numpy as np
+
 LOG = logging.getLogger(__name__)
 
 
+def nearest_points(lat, lon, latitude=None, longitude=None):
+    """Returns the indices of the grid points nearest to `latitude` and `longitude`.
+    If only one of them is given, all the points of the nearest parallel (or meridian)
+    are selected.
+    """
+    mask = np.ones(len(lat), dtype=bool)
+
+    if latitude is not None:
+        nearest = lat[np.argmin(np.abs(lat - latitude))]
+        mask &= lat == nearest
+
+    if longitude is not None:
+        candidates = np.flatnonzero(mask)
+        # Distance in degrees, taking into account the wrap around
+        distance = np.abs((lon[candidates] - longitude + 180) % 360 - 180)
+        nearest = lon[candidates[np.argmin(distance)]]
+        mask &= lon == nearest
+
+    return np.flatnonzero(mask)
+
+
 class PandasMixIn:
     def to_pandas(self, latitude=None, longitude=None, **kwargs):
         import pandas as pd
 
-        def ident(x):
-            return x
+        select = latitude is not None or longitude is not None
+
+        # Fields on the same grid share the same geometry (see GribField.grid_points),
+        # so the selected points are only computed once per grid. The metadata and
+        # the values of each field are read in the same pass on the fields.
+        grids = {}
+        lats, lons, values = [], [], []
+        sizes = []
+        datetimes = []
+        mars = {}
+
+        for i, s in enumerate(self):
+            lat, lon = s.grid_points()
+            if id(lat) not in grids:
+                indices = None
+                if select:
+                    indices = nearest_points(lat, lon, latitude, longitude)
+                # The grid is kept, so that its id() is not reused
+                grids[id(lat)] = (
+                    lat,
+                    (lat, lon) if indices is None else (lat[indices], lon[indices]),
+                    indices,
+                )
+            _, (lat, lon), indices = grids[id(lat)]
+
+            v = s.to_numpy(reshape=False)
+            lats.append(lat)
+            lons.append(lon)
+            values.append(v if indices is None else v[indices])
+            sizes.append(len(lat))
+
+            datetimes.append(s.valid_datetime())
+            for key, value in s.as_mars().items():
+                column = mars.setdefault(key, [])
+                column.extend([None] * (i - len(column)))
+                column.append(value)
+
+        for column in mars.values():
+            column.extend([None] * (len(sizes) - len(column)))
+
+        sizes = np.array(sizes, dtype=np.int64)
+        total = int(sizes.sum())
+
+        def concatenate(arrays):
+            return np.concatenate(arrays) if arrays else np.empty(0)
+
+        lats = concatenate(lats)
+        lons = concatenate(lons)
+        values = concatenate(values).astype(np.float64, copy=False)
 
-        filter = ident
+        def repeat(column):
+            # One categorical per key, repeated for all the points of each field
+            column = pd.Categorical(column)
+            return pd.Categorical.from_codes(
+                np.repeat(column.codes, sizes),
+                categories=column.categories,
+            )
 
-        def select_point(d):
-            return [x for x in d if x["lat"] == latitude and x["lon"] == longitude]
+        columns = dict(lat=lats, lon=lons, value=values)
+        columns["datetime"] = np.repeat(pd.to_datetime(datetimes).values, sizes)
+        for k, v in mars.items():
+            columns[k] = repeat(v)
 
-        if latitude is not None or longitude is not None:
-            filter = select_point
+        # Same index as when the frames of each field are concatenated
+        index = np.concatenate([np.arange(n) for n in sizes]) if total else []
 
-        frames = []
-        for s in self:
-            df = pd.DataFrame(filter(s.data))
-            df["datetime"] = s.valid_datetime()
-            for k, v in s.as_mars().items():
-                df[k] = v
-            frames.append(df)
-        return pd.concat(frames)
+        return pd.DataFrame(columns, index=index)
@@ -0,0 +1,165 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+import math
+import os
+import sys
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from climetlab.readers.grib.codes import GribField
+
+LOG = logging.getLogger(__name__)
+
+PARALLEL_MODES = ("threads", "processes")
+
+
+def _chunks(indices, count):
+    size = max(1, len(indices) // count)
+    return [indices[i : i + size] for i in range(0, len(indices), size)]
+
+
+def _decode_in_threads(fields, out, indices, max_workers, kwargs):
+    def decode(i):
+        out[i] = fields[i].to_numpy(**kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Consume the iterator to re-raise the exceptions of the workers
+        list(pool.map(decode, indices))
+
+
+def _grib_parts(fields, indices):
+    """Returns the (index, path, offset, length) of the messages of the fields
+    at `indices`, or None if they cannot all be read again by other processes.
+    """
+    parts = []
+    for i in indices:
+        f = fields[i]
+        if not isinstance(f, GribField) or f._offset is None or f._length is None:
+            return None
+        parts.append((i, f.path, f._offset, f._length))
+    return parts
+
+
+def _shared_array(shape, dtype):
+    """Returns an array in a new block of shared memory, and the block. The memory
+    is released when the array (and all its views) are garbage collected.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+
+    dtype = np.dtype(dtype)
+    shm = SharedMemory(create=True, size=max(1, math.prod(shape) * dtype.itemsize))
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    finalizer = weakref.finalize(array, shm.close)
+    finalizer.atexit = False
+    return array, shm
+
+
+def _decode_into_shared_memory(name, shape, dtype, parts, kwargs):
+    from multiprocessing.shared_memory import SharedMemory
+
+    shm = SharedMemory(name=name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        for i, path, offset, length in parts:
+            out[i] = GribField(path, offset, length).to_numpy(**kwargs)
+        del out
+    finally:
+        shm.close()
+
+
+def _decode_in_processes(parts, result, shm, max_workers, kwargs):
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(
+                    _decode_into_shared_memory,
+                    shm.name,
+                    result.shape,
+                    result.dtype.str,
+                    chunk,
+                    kwargs,
+                )
+                for chunk in _chunks(parts, max_workers * 4)
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        # The memory stays mapped in this process until `result` is released
+        shm.unlink()
+
+
+def decode_fields(fields, parallel, max_workers=None, dtype=None, out=None, **kwargs):
+    """Same as :py:func:`climetlab.core.index.fields_to_numpy`, but the fields
+    are decoded concurrently by `max_workers` workers (one per CPU by default).
+
+    With `parallel="threads"` (or True), the fields are decoded by a pool of threads,
+    writing directly in the output array. With `parallel="processes"`, they are
+    decoded by a pool of processes, writing directly in an array in shared memory,
+    which is returned (unless `out` is given, in which case it is copied to `out`).
+    Fields that cannot be read again by other processes are decoded in threads.
+    """
+    if parallel is True:
+        parallel = "threads"
+
+    if parallel not in PARALLEL_MODES:
+        raise ValueError(
+            f"Invalid value parallel={parallel}, expected {PARALLEL_MODES}"
+        )
+
+    if len(fields) == 0:
+        return np.array([], dtype=dtype) if out is None else out
+
+    if dtype is not None:
+        kwargs["dtype"] = dtype
+
+    # Decode the first field to get the shape and type of the result
+    values = fields[0].to_numpy(**kwargs)
+    shape = (len(fields),) + values.shape
+    if dtype is None:
+        dtype = values.dtype
+    if out is not None and out.shape != shape:
+        raise ValueError(f"Invalid output shape {out.shape}, expected {shape}")
+
+    indices = list(range(1, len(fields)))
+
+    if max_workers is None or max_workers <= 0:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(indices)))
+
+    parts = None
+    if parallel == "processes" and indices:
+        if sys.platform == "win32":
+            # Deactivate multiprocessing for windows
+            LOG.debug("Decoding the fields in threads on Windows")
+        else:
+            parts = _grib_parts(fields, indices)
+            if parts is None:
+                LOG.debug(
+                    "Some fields cannot be read by other processes, using threads"
+                )
+
+    if parts is not None:
+        result, shm = _shared_array(shape, dtype)
+        result[0] = values
+        _decode_in_processes(parts, result, shm, max_workers, kwargs)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    out[0] = values
+    if indices:
+        _decode_in_threads(fields, out, indices, max_workers, kwargs)
+    return out
@@ -8,13 +8,15 @@
 #
 import datetime
 import logging
+import mmap
 import os
 import sys
-import time
-from multiprocessing import Process, Queue
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from tqdm import tqdm
 
+from climetlab.core.settings import SETTINGS
 from climetlab.utils import progress_bar
 from climetlab.utils.humanize import plural, seconds
 
@@ -53,7 +55,10 @@ def post_process_parameter_level(field, h):
 
 
 def post_process_statistics(field, h):
-    values = h.get("values")
+    return _values_statistics(field, h.get("values"))
+
+
+def _values_statistics(field, values):
     field["mean"] = values.mean()
     field["std"] = values.std()
     field["min"] = values.min()
@@ -68,11 +73,15 @@ def _index_grib_file(
     with_valid_date=True,
     with_parameter_level=True,
     position=0,
+    native=None,
 ):
     import eccodes
 
     from climetlab.readers.grib.codes import CodesHandle
 
+    if native is None:
+        native = SETTINGS.get("use-native-grib-header-parser")
+
     post_process_mars = []
     if with_valid_date:
         post_process_mars.append(post_process_valid_date)
@@ -113,6 +122,17 @@ def _index_grib_file(
         dynamic_ncols=True,
     )
 
+    if native:
+        yield from _parse_grib_file_headers(
+            path,
+            pbar,
+            with_statistics=with_statistics,
+            with_valid_date=with_valid_date,
+            with_parameter_level=with_parameter_level,
+        )
+        pbar.close()
+        return
+
     with open(path, "rb") as f:
         old_position = f.tell()
         h = eccodes.codes_grib_new_from_file(f)
@@ -128,6 +148,77 @@ def _index_grib_file(
     pbar.close()
 
 
+def _parse_grib_file_headers(
+    path,
+    pbar,
+    with_statistics=False,
+    with_valid_date=True,
+    with_parameter_level=True,
+):
+    """Same as _index_grib_file(), parsing the headers of the messages
+    in Python when possible (see climetlab.readers.grib.headers)
+    """
+    import eccodes
+
+    from climetlab.readers.grib.codes import CodesHandle, scan_messages_positions
+    from climetlab.readers.grib.headers import HeadersParser, decode_values
+
+    def handle(message):
+        return CodesHandle(eccodes.codes_new_from_message(bytes(message)), path, None)
+
+    def decode(message):
+        h = handle(message)
+        field = h.as_mars()
+        if with_valid_date:
+            field = post_process_valid_date(field, h)
+        field["_param_id"] = h.get_string("paramId")
+        field["md5_grid_section"] = h.get("md5GridSection")
+        return field
+
+    offsets, lengths = scan_messages_positions(path)
+    if len(offsets) == 0:
+        return
+
+    parser = HeadersParser(decode)
+
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for offset, length in zip(offsets.tolist(), lengths.tolist()):
+                    message = view[offset : offset + length]
+
+                    field, headers = parser.parse(message)
+
+                    if with_parameter_level:
+                        field = post_process_parameter_level(field, None)
+
+                    if with_statistics:
+                        values = None
+                        if headers is not None:
+                            values = decode_values(message, headers)
+                        if values is None:
+                            values = handle(message).get("values")
+                        field = _values_statistics(field, values)
+
+                    field["_path"] = path
+                    field["_offset"] = offset
+                    field["_length"] = length
+
+                    del message
+                    pbar.update(length)
+                    yield field
+            finally:
+                view.release()
+
+    LOG.debug(
+        "%s: %s messages parsed, %s decoded by eccodes",
+        path,
+        parser.parsed,
+        parser.decoded,
+    )
+
+
 def _index_url(url):
     import climetlab as cml
 
@@ -148,6 +239,24 @@ def _index_path(path):
         yield from _index_grib_file(path)
 
 
+def _parse_path(path, formatted_path, with_statistics, position):
+    LOG.debug(f"Parsing file {path}")
+
+    entries = []
+    for field in _index_grib_file(
+        path,
+        with_statistics=with_statistics,
+        position=position,
+    ):
+        field["_path"] = formatted_path
+        entries.append(field)
+
+    if not entries:
+        LOG.warning(f"No entry found in {path}.")
+
+    return entries
+
+
 class GribIndexingDirectoryParserIterator:
     """This class delays parsing the directory for the list of files
     until the iterator is actually used (calling __iter__)
@@ -162,6 +271,7 @@ class GribIndexingDirectoryParserIterator:
         followlinks=True,
         verbose=False,
         with_statistics=True,
+        reindex=False,
     ):
         self.db_path = db_path
         self.extensions = set(extensions)
@@ -170,6 +280,7 @@ class GribIndexingDirectoryParserIterator:
         self.followlinks = followlinks
         self.verbose = verbose
         self.with_statistics = with_statistics
+        self.reindex = reindex
 
         self._tasks = None
 
@@ -178,90 +289,131 @@ class GribIndexingDirectoryParserIterator:
 
         return SqlDatabase(self.db_path)
 
-    def worker(self, i):
-        _i = i
-        time.sleep(i)
-        while True:
-            task = self.q_in.get()
-            if task is None:
-                break
-            n = self.process_path(_i, task)
-            self.q_out.put(n)
-
     def load_database(self):
+        """Parses the files in parallel processes and inserts their entries in
+        the database from this process only, so that the workers never wait
+        for the lock of the database.
+
+        Files already loaded are skipped. With `reindex`, the files that have
+        changed since they were loaded are parsed again, and the entries of the
+        files that no longer exist are deleted. The entries of a changed file
+        are only replaced if it can be parsed.
+
+        The files that cannot be parsed are not recorded as loaded, so that they
+        are parsed again on the next call. Once the entries of the other files
+        are inserted, a ValueError listing them is raised.
+        """
         start = datetime.datetime.now()
 
-        n_proc = 5
-        if sys.platform == "win32":
-            n_proc = 1  # deactivate multiprocessing for window
-
-        if n_proc == 1:
-            count = 0
-            for path in self.tasks:
-                count += self.process_path(0, path)
-        else:
-            assert n_proc > 1, n_proc
-
-            self.q_in = Queue()
-            self.q_out = Queue()
-
-            workers = []
-            for i in range(n_proc):
-                proc = Process(target=self.worker, args=(i,))
-                proc.start()
-                workers.append(proc)
-
-            for path in self.tasks:
-                self.q_in.put(path)
-
-            for i in range(n_proc):
-                self.q_in.put(None)
-
-            count = 0
-            for _ in progress_bar(iterable=self.tasks, total=len(self.tasks)):
-                count += self.q_out.get()
-
-            for p in workers:
-                p.join()
-
-            del self.q_in
-            del self.q_out
+        db = self._new_db()
+        loaded = db.paths_stats()
 
-        self._new_db().build_indexes()
+        tasks = []
+        stats = {}
+        replace = set()
+        for path in self.tasks:
+            key = self._format_path(path)
+            st = os.stat(path)
+            stat = (st.st_size, st.st_mtime, st.st_ino)
+            if key in loaded:
+                if not self.reindex:
+                    LOG.warning(f"Skipping {path}, already loaded")
+                    continue
+                if loaded[key] == stat:
+                    continue
+                LOG.debug(f"{path} has changed since it was loaded")
+                replace.add(key)
+            tasks.append(path)
+            stats[key] = stat
+
+        if self.reindex:
+            removed = set(loaded) - set(self._format_path(p) for p in self.tasks)
+            if removed:
+                LOG.debug(f"Deleting the entries of {plural(len(removed), 'file')}")
+                db.delete_paths(removed)
+
+        batch_size = SETTINGS.get("number-of-entries-per-insert")
+
+        count = 0
+        pending = []
+        pending_stats = {}
+
+        def flush():
+            # The previous entries of the files are replaced in the same transaction
+            nonlocal count
+            if pending or pending_stats.keys() & replace:
+                count += db.load_iterator(
+                    pending,
+                    stats=pending_stats,
+                    replace=pending_stats.keys() & replace,
+                )
+            pending.clear()
+            pending_stats.clear()
+
+        failed = []
+        for path, (entries, error) in progress_bar(
+            iterable=zip(tasks, self._parse(tasks)), total=len(tasks)
+        ):
+            if error is not None:
+                # Not recorded, so the previous entries of a changed file are kept
+                failed.append(path)
+                continue
+            key = self._format_path(path)
+            pending.extend(entries)
+            pending_stats[key] = stats[key]
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+
+        db.build_indexes()
 
         end = datetime.datetime.now()
         print(f"Indexed {plural(count,'field')} in {seconds(end - start)}.")
 
-    def process_path(self, i, path):
-        db = self._new_db()
-
-        if db.already_loaded(self._format_path(path), self):
-            LOG.warning(f"Skipping {path}, already loaded")
-            return 0
-
-        lst = []
-        LOG.debug(f"Parsing file {path}")
-
-        try:
-            for field in _index_grib_file(
-                path,
-                with_statistics=self.with_statistics,
-                position=i + 1,
-            ):
-                field["_path"] = self._format_path(path)
-                lst.append(field)
-        except PermissionError as e:
-            LOG.error(f"Could not read {path}: {e}")
-            return 0
-        except Exception as e:
-            LOG.exception(f"(grib-parsing) Ignoring {path}, {e}")
-            return 0
-
-        if not lst:
-            LOG.warn(f"No entry found in {path}.")
-            return 0
-
-        return db.load_iterator(lst)
+        if failed:
+            raise ValueError(
+                f"Could not index {plural(len(failed), 'file')}: {', '.join(failed)}"
+            )
+
+    def _parse(self, tasks):
+        # Yields the entries of each file and the error raised while parsing it,
+        # if any, in the order of `tasks`
+        max_workers = SETTINGS.get("number-of-grib-indexing-workers")
+        if max_workers <= 0:
+            max_workers = os.cpu_count() or 1
+        if sys.platform == "win32":
+            max_workers = 1  # deactivate multiprocessing for window
+        max_workers = min(max_workers, len(tasks))
+
+        args = [
+            (path, self._format_path(path), self.with_statistics, i % max_workers + 1)
+            for i, path in enumerate(tasks)
+        ]
+
+        def result(path, parse):
+            try:
+                return parse(), None
+            except Exception as e:
+                LOG.error(f"Could not parse {path}: {e}")
+                return [], e
+
+        if max_workers <= 1:
+            for a in args:
+                yield result(a[0], lambda: _parse_path(*a))
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # At most two files per worker are waiting to be inserted,
+            # errors in the workers are raised by result()
+            queue = deque()
+            for a in args:
+                queue.append((a[0], pool.submit(_parse_path, *a)))
+                if len(queue) >= 2 * max_workers:
+                    path, future = queue.popleft()
+                    yield result(path, future.result)
+            while queue:
+                path, future = queue.popleft()
+                yield result(path, future.result)
 
     @property
     def tasks(self):
@@ -0,0 +1,215 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+"""Decoding of GRIB fields packed with simple packing ('grid_simple') with NumPy,
+without going through eccodes. The packing parameters and the positions of the
+bitmap and data sections are read from the headers of the message.
+"""
+
+import logging
+
+import numpy as np
+
+LOG = logging.getLogger(__name__)
+
+SIMPLE_PACKING_KEYS = (
+    "packingType",
+    "bitsPerValue",
+    "referenceValue",
+    "binaryScaleFactor",
+    "decimalScaleFactor",
+    "bitmapPresent",
+    "bitMapIndicator",
+    "numberOfDataPoints",
+    "numberOfCodedValues",
+    "missingValue",
+    "offsetBeforeData",
+    "offsetAfterData",
+    "offsetBeforeBitmap",
+    "offsetSection6",
+    "alternativeRowScanning",
+    "unitsFactor",
+    "unitsBias",
+)
+
+# Larger values do not fit in the 64 bits words used by unpack_bits()
+MAX_BITS_PER_VALUE = 57
+
+# Values converted to floating point at a time
+CHUNK_SIZE = 1024 * 1024
+
+
+def power(s, n):
+    """Same as eccodes' codes_power(), so that the scale factors are bit-identical"""
+    if s == 0:
+        return 1.0
+    if s == 1:
+        return float(n)
+    result = 1.0
+    while s < 0:
+        result /= n
+        s += 1
+    while s > 0:
+        result *= n
+        s -= 1
+    return result
+
+
+def unpack_bits(data, bits_per_value, count):
+    """Returns the `count` unsigned integers of `bits_per_value` bits packed in `data`,
+    most significant bit first, as an array of unsigned integers.
+    """
+    assert 0 < bits_per_value <= MAX_BITS_PER_VALUE, bits_per_value
+
+    if bits_per_value in (8, 16, 32):
+        dtype = np.dtype(">u%d" % (bits_per_value // 8))
+        return np.frombuffer(data, dtype=dtype, count=count)
+
+    # 8 consecutive values use exactly `bits_per_value` bytes, so value i + 8k
+    # starts at a fixed bit position in a 64 bits word read at a fixed stride.
+    # The data is padded so that the last words can be read entirely.
+    padded = np.zeros(len(data) + 8, dtype=np.uint8)
+    padded[: len(data)] = np.frombuffer(data, dtype=np.uint8)
+
+    result = np.empty(count, dtype=np.uint64)
+    mask = np.uint64((1 << bits_per_value) - 1)
+    for j in range(min(8, count)):
+        first_bit = j * bits_per_value
+        n = len(range(j, count, 8))
+        words = np.ndarray(
+            shape=(n,),
+            dtype=">u8",
+            buffer=padded,
+            offset=first_bit // 8,
+            strides=(bits_per_value,),
+        )
+        shift = np.uint64(64 - first_bit % 8 - bits_per_value)
+        result[j::8] = (words >> shift) & mask
+
+    return result
+
+
+def _simple_packing_parameters(header):
+    keys = header.get_many(SIMPLE_PACKING_KEYS)
+
+    if keys["packingType"] != "grid_simple":
+        return None
+
+    if keys["alternativeRowScanning"] or keys["bitsPerValue"] > MAX_BITS_PER_VALUE:
+        return None
+
+    if keys["unitsFactor"] not in (None, 1) or keys["unitsBias"] not in (None, 0):
+        return None
+
+    if keys["bitmapPresent"]:
+        # Only bitmaps included in the message are supported
+        if keys["bitMapIndicator"] != 0:
+            return None
+        if keys["offsetBeforeBitmap"] is None and keys["offsetSection6"] is None:
+            return None
+
+    return keys
+
+
+def _bitmap_offset(keys):
+    if keys["offsetBeforeBitmap"] is not None:  # GRIB1
+        return keys["offsetBeforeBitmap"]
+    # GRIB2: length (4 bytes), section number and bitmap indicator
+    return keys["offsetSection6"] + 6
+
+
+def unpack_values(
+    data,
+    bits_per_value,
+    count,
+    reference_value,
+    binary_scale_factor,
+    decimal_scale_factor,
+    dtype=np.float64,
+):
+    """Returns the `count` values packed with simple packing in `data`"""
+    if bits_per_value == 0:
+        return np.full(count, reference_value, dtype=dtype)
+
+    integers = unpack_bits(data, bits_per_value, count)
+
+    # Same operations as eccodes, in double precision
+    s = power(binary_scale_factor, 2)
+    d = power(-decimal_scale_factor, 10)
+
+    values = np.empty(count, dtype=dtype)
+    for i in range(0, count, CHUNK_SIZE):
+        chunk = integers[i : i + CHUNK_SIZE].astype(np.float64)
+        chunk *= s
+        chunk += reference_value
+        chunk *= d
+        values[i : i + CHUNK_SIZE] = chunk
+
+    return values
+
+
+def apply_bitmap(coded, bitmap, points, missing_value, dtype=np.float64):
+    """Returns the `points` values of a field from its `coded` values and its
+    `bitmap`, or None if they are not consistent
+    """
+    bitmap = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=points)
+    bitmap = bitmap.astype(bool)
+    if np.count_nonzero(bitmap) != len(coded):
+        return None
+
+    values = np.full(points, missing_value, dtype=dtype)
+    values[bitmap] = coded
+    return values
+
+
+def decode_simple_packing(field, dtype=np.float64):
+    """Returns the values of the GRIB `field` as an array of type `dtype`,
+    or None if the field is not packed with simple packing.
+    """
+    from climetlab.readers.grib.codes import CodesReader
+
+    keys = _simple_packing_parameters(field.header)
+    if keys is None:
+        return None
+
+    reader = CodesReader.from_cache(field.path)
+    offset = field.offset
+
+    bits_per_value = keys["bitsPerValue"]
+    count = keys["numberOfCodedValues"]
+    points = keys["numberOfDataPoints"]
+
+    data = b""
+    if bits_per_value > 0:
+        start, end = keys["offsetBeforeData"], keys["offsetAfterData"]
+        if (end - start) * 8 < count * bits_per_value:
+            LOG.warning("%s: data section too short, using eccodes", field)
+            return None
+        data = reader.read_bytes(offset + start, end - start)
+
+    coded = unpack_values(
+        data,
+        bits_per_value,
+        count,
+        keys["referenceValue"],
+        keys["binaryScaleFactor"],
+        keys["decimalScaleFactor"],
+        dtype,
+    )
+
+    if not keys["bitmapPresent"]:
+        if count != points:
+            return None
+        return coded
+
+    bitmap = reader.read_bytes(offset + _bitmap_offset(keys), (points + 7) // 8)
+    values = apply_bitmap(coded, bitmap, points, keys["missingValue"], dtype)
+    if values is None:
+        LOG.warning("%s: inconsistent bitmap, using eccodes", field)
+    return values
@@ -0,0 +1,213 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from climetlab.core.caching import cache_file
+from climetlab.readers.grib.codes import GribField
+
+from .parallel import PARALLEL_MODES, _chunks, _grib_parts
+
+LOG = logging.getLogger(__name__)
+
+
+class Moments:
+    """Number of values, mean, sum of the squares of the differences to the mean,
+    minimum and maximum of a set of values. The moments of two sets of values
+    are merged without going through the values again (Chan et al.), so fields
+    can be reduced one at a time, or in parallel.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=math.inf, maximum=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_values(cls, values, missing_value=None):
+        """Moments of `values`, ignoring NaNs and `missing_value`"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+
+        valid = ~np.isnan(values)
+        if missing_value is not None:
+            valid &= values != missing_value
+        if not valid.all():
+            values = values[valid]
+
+        if len(values) == 0:
+            return cls()
+
+        mean = float(np.mean(values))
+        return cls(
+            count=len(values),
+            mean=mean,
+            m2=float(np.sum(np.square(values - mean))),
+            minimum=float(np.min(values)),
+            maximum=float(np.max(values)),
+        )
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def stdev(self):
+        # Population standard deviation
+        if self.count == 0:
+            return math.nan
+        return math.sqrt(self.m2 / self.count)
+
+    def __repr__(self):
+        return (
+            f"Moments(count={self.count}, mean={self.mean}, stdev={self.stdev},"
+            f" minimum={self.minimum}, maximum={self.maximum})"
+        )
+
+
+def _missing_value(field):
+    header = getattr(field, "header", None)
+    if header is None or not header.get("bitmapPresent"):
+        return None
+    return header.get("missingValue")
+
+
+def field_moments(field):
+    """Moments of the values of `field`, without its missing values"""
+    return Moments.from_values(field.to_numpy(reshape=False), _missing_value(field))
+
+
+def _reduce(fields):
+    result = Moments()
+    for field in fields:
+        result.merge(field_moments(field))
+    return result
+
+
+def _reduce_parts(parts):
+    return _reduce(GribField(path, offset, length) for path, offset, length in parts)
+
+
+def fields_moments(fields, parallel=False, max_workers=None):
+    """Moments of the values of all `fields`, reducing each field to scalars
+    as they are decoded. With `parallel` set to "threads" (or True) or "processes",
+    chunks of fields are reduced concurrently by `max_workers` workers.
+    """
+    if not parallel or len(fields) < 2:
+        return _reduce(fields)
+
+    if parallel is True:
+        parallel = "threads"
+
+    if parallel not in PARALLEL_MODES:
+        raise ValueError(
+            f"Invalid value parallel={parallel}, expected {PARALLEL_MODES}"
+        )
+
+    if max_workers is None or max_workers <= 0:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(fields))
+
+    parts = None
+    if parallel == "processes":
+        if sys.platform == "win32":
+            # Deactivate multiprocessing for windows
+            LOG.debug("Reducing the fields in threads on Windows")
+        else:
+            parts = _grib_parts(fields, range(len(fields)))
+            if parts is None:
+                LOG.debug(
+                    "Some fields cannot be read by other processes, using threads"
+                )
+
+    if parts is not None:
+        parts = [(path, offset, length) for _, path, offset, length in parts]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_reduce_parts, _chunks(parts, max_workers * 4)))
+    else:
+        chunks = _chunks(list(fields), max_workers * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_reduce, chunks))
+
+    # Merged in order, so that the result does not depend on the scheduling
+    result = Moments()
+    for r in results:
+        result.merge(r)
+    return result
+
+
+def _cache_args(fields):
+    # The files, with their modification times and sizes, and the positions
+    # of the selected messages in these files
+    paths = {}
+    files = []
+    selection = hashlib.sha256()
+    for field in fields:
+        if not isinstance(field, GribField) or field._offset is None:
+            return None
+        if field.path not in paths:
+            stat = os.stat(field.path)
+            paths[field.path] = len(files)
+            files.append((field.path, stat.st_ctime, stat.st_mtime, stat.st_size))
+        selection.update(
+            f"{paths[field.path]},{field._offset},{field._length};".encode()
+        )
+
+    return dict(files=files, selection=selection.hexdigest())
+
+
+def _as_dict(moments, count):
+    return dict(
+        minimum=moments.minimum if moments.count else math.nan,
+        maximum=moments.maximum if moments.count else math.nan,
+        average=moments.mean if moments.count else math.nan,
+        stdev=moments.stdev,
+        count=count,
+    )
+
+
+def fields_statistics(fields, parallel=False, max_workers=None):
+    """Minimum, maximum, average and standard deviation of the values of all
+    `fields`. For fields from GRIB files, the results are kept in the cache,
+    keyed by the files and the messages selected, so they are only computed once.
+    """
+    args = _cache_args(fields) if len(fields) else None
+    if args is None:
+        return _as_dict(fields_moments(fields, parallel, max_workers), len(fields))
+
+    def create(target, args):
+        moments = fields_moments(fields, parallel, max_workers)
+        with open(target, "w") as f:
+            json.dump(_as_dict(moments, len(fields)), f)
+
+    path = cache_file("grib-statistics", create, args, extension=".json")
+    with open(path) as f:
+        return json.load(f)
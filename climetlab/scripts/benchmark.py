@@ -15,6 +15,9 @@ from tqdm import tqdm
 
 import climetlab as cml
 
+from .benchmarks.grib_decode import benchmark as benchmark_grib_decode
+from .benchmarks.grib_index import benchmark as benchmark_grib_index
+from .benchmarks.grib_scan import benchmark as benchmark_grib_scan
 from .benchmarks.indexed_url import benchmark as benchmark_indexed_url
 from .tools import experimental, parse_args
 
@@ -169,6 +172,18 @@ class BenchmarkCmd:
             action="store_true",
             help="Test loading some data.",
         ),
+        gribscan=dict(
+            action="store_true",
+            help="Benchmark finding the positions of the messages in GRIB files.",
+        ),
+        gribdecode=dict(
+            action="store_true",
+            help="Benchmark decoding GRIB files in parallel.",
+        ),
+        gribindex=dict(
+            action="store_true",
+            help="Benchmark extracting the metadata of GRIB files to index them.",
+        ),
         nargs=dict(nargs="*"),
         all=dict(action="store_true", help="Run all benchmarks."),
     )
@@ -182,3 +197,15 @@ class BenchmarkCmd:
         if args.all or args.dataloading:
             print("Starting benchmark.")
             benchmark_dataloading(*args.nargs)
+
+        if args.all or args.gribscan:
+            print("Starting benchmark.")
+            benchmark_grib_scan(*args.nargs)
+
+        if args.all or args.gribdecode:
+            print("Starting benchmark.")
+            benchmark_grib_decode(*args.nargs)
+
+        if args.all or args.gribindex:
+            print("Starting benchmark.")
+            benchmark_grib_index(*args.nargs)
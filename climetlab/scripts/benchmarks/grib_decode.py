@@ -0,0 +1,59 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+import time
+
+import climetlab as cml
+from climetlab.utils.humanize import bytes, seconds
+
+
+def _time(paths, repeat, **kwargs):
+    best = None
+    for _ in range(repeat):
+        # New fields, so that the values are decoded again
+        ds = cml.load_source("multi", *[cml.load_source("file", p) for p in paths])
+        start = time.time()
+        result = ds.to_numpy(**kwargs)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark(*paths, repeat=3):
+    if not paths:
+        print(
+            """
+        Usage:
+
+        $0 path1.grib path2.grib ...:
+        Compare the time taken to decode all the fields of the GRIB files
+        with to_numpy(), serially and with an increasing number of workers.
+        """
+        )
+        return
+
+    serial, expected = _time(paths, repeat)
+
+    print(f"{len(expected)} fields, {bytes(expected.nbytes)}")
+    print(f"   serial: {seconds(serial)}")
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        for parallel in ("threads", "processes"):
+            elapsed, result = _time(
+                paths, repeat, parallel=parallel, max_workers=workers
+            )
+            assert result.tobytes() == expected.tobytes(), "Results differ"
+            print(
+                f"   {parallel:9s} x{workers:<3d}: {seconds(elapsed)}"
+                f" (speedup: {serial / elapsed:.1f}x)"
+            )
+        workers *= 2
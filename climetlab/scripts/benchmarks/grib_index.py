@@ -0,0 +1,56 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+import time
+
+from climetlab.readers.grib.parsing import _index_grib_file
+from climetlab.utils.humanize import bytes, seconds
+
+
+def _time(path, repeat, **kwargs):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = list(_index_grib_file(path, **kwargs))
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark(*paths, repeat=3):
+    if not paths:
+        print(
+            """
+        Usage:
+
+        $0 path1.grib path2.grib ...:
+        Compare the time taken to extract the metadata of all the messages
+        of each file, with eccodes and with the native GRIB header parser.
+        """
+        )
+        return
+
+    for path in paths:
+        size = os.path.getsize(path)
+        for with_statistics in (False, True):
+            t1, r1 = _time(path, repeat, with_statistics=with_statistics, native=False)
+            t2, r2 = _time(path, repeat, with_statistics=with_statistics, native=True)
+
+            assert r1 == r2, f"Parsers disagree on {path}"
+
+            print(
+                f"{path}: {len(r1)} messages, {bytes(size)},"
+                f" statistics: {with_statistics}"
+            )
+            print(f"   eccodes: {seconds(t1)}")
+            print(f"   native:  {seconds(t2)}")
+            if t2 > 0:
+                print(f"   speedup: {t1 / t2:.1f}x")
@@ -0,0 +1,67 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+import time
+
+from climetlab.readers.grib.codes import get_messages_positions, scan_messages_positions
+from climetlab.utils.humanize import bytes, seconds
+
+
+def _generator(path):
+    offsets = []
+    lengths = []
+    for offset, length in get_messages_positions(path):
+        offsets.append(offset)
+        lengths.append(length)
+    return offsets, lengths
+
+
+def _scanner(path):
+    offsets, lengths = scan_messages_positions(path)
+    return offsets.tolist(), lengths.tolist()
+
+
+def _time(func, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func(path)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark(*paths, repeat=3):
+    if not paths:
+        print(
+            """
+        Usage:
+
+        $0 path1.grib path2.grib ...:
+        Compare the time taken to find the position of the GRIB messages in each
+        file, using get_messages_positions() and scan_messages_positions().
+        """
+        )
+        return
+
+    for path in paths:
+        size = os.path.getsize(path)
+
+        t1, r1 = _time(_generator, path, repeat)
+        t2, r2 = _time(_scanner, path, repeat)
+
+        assert r1 == r2, f"Scanners disagree on {path}"
+
+        print(f"{path}: {len(r1[0])} messages, {bytes(size)}")
+        print(f"   get_messages_positions:  {seconds(t1)}")
+        print(f"   scan_messages_positions: {seconds(t2)}")
+        if t2 > 0:
+            print(f"   speedup: {t1 / t2:.1f}x")
@@ -75,6 +75,13 @@ class GribCmd:
         directory=(None, dict(help="Directory containing the GRIB files to index.")),
         # pattern=dict(help="Files to index (patterns).", nargs="*"),
         no_follow_links=dict(action="store_true", help="Do not follow symlinks."),
+        reindex=dict(
+            action="store_true",
+            help=(
+                "Only index the files that are new or have changed since they were indexed, "
+                "and remove the files that no longer exist from the index."
+            ),
+        ),
         relative_paths=dict(
             action="store_true",
             help=(
@@ -132,6 +139,7 @@ class GribCmd:
             relative_paths=relative_paths,
             followlinks=followlinks,
             with_statistics=True,
+            reindex=args.reindex,
         )
         parser.load_database()
 
@@ -15,6 +15,7 @@ import os
 from climetlab import load_source
 from climetlab.core.settings import SETTINGS
 from climetlab.readers import reader
+from climetlab.readers.grib import index_grib_files
 
 from . import Source
 
@@ -42,6 +43,7 @@ class FileSource(Source, os.PathLike, metaclass=FileSourceMeta):
             if len(self.path) == 1:
                 self.path = self.path[0]
             else:
+                index_grib_files(self.path)
                 return load_source(
                     "multi",
                     [load_source("file", p) for p in self.path],
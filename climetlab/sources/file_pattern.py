@@ -7,6 +7,7 @@
 # nor does it submit to any jurisdiction.
 #
 
+from climetlab.readers.grib import index_grib_files
 from climetlab.sources.file import File
 from climetlab.sources.multi import MultiSource
 from climetlab.utils.patterns import Pattern
@@ -18,7 +19,10 @@ class FilePattern(MultiSource):
         if not isinstance(files, list):
             files = [files]
 
-        sources = [File(file) for file in sorted(files)]
+        files = sorted(files)
+        index_grib_files(files)
+
+        sources = [File(file) for file in files]
         super().__init__(sources, filter=filter, merger=merger)
 
 
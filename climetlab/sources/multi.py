@@ -15,6 +15,7 @@ from climetlab.mergers import make_merger, merge_by_class
 from climetlab.sources.empty import EmptySource
 from climetlab.utils import tqdm
 from climetlab.utils.bbox import BoundingBox
+from climetlab.utils.offsets import CumulativeLengths
 
 from . import Source
 
@@ -31,7 +32,7 @@ class MultiSource(Source):
         self.sources = [s.mutate() for s in sources if not s.ignore()]
         self.filter = filter
         self.merger = merger
-        self._lengths = [None] * len(self.sources)
+        self._lengths = CumulativeLengths(self.sources)
 
     def ignore(self):
         return len(self.sources) == 0
@@ -59,13 +60,7 @@ class MultiSource(Source):
         return itertools.chain(*self.sources)
 
     def __getitem__(self, n):
-        if n < 0:
-            n = len(self) + n
-
-        i = 0
-        while n >= self._length(i):
-            n -= self._length(i)
-            i += 1
+        i, n = self._lengths.locate(n)
         return self.sources[i][n]
 
     def sel(self, *args, **kwargs):
@@ -77,12 +72,7 @@ class MultiSource(Source):
         return self.__class__(new_sources, filter=self.filter, merger=self.merger)
 
     def __len__(self):
-        return sum(self._length(i) for i, _ in enumerate(self.sources))
-
-    def _length(self, i):
-        if self._lengths[i] is None:
-            self._lengths[i] = len(self.sources[i])
-        return self._lengths[i]
+        return len(self._lengths)
 
     def __repr__(self) -> str:
         string = ",".join(repr(s) for s in self.sources)
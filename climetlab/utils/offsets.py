@@ -0,0 +1,89 @@
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import bisect
+import itertools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from climetlab.core.settings import SETTINGS
+
+LOG = logging.getLogger(__name__)
+
+
+class CumulativeLengths:
+    """Positions of the elements of a concatenation of `parts`, to find the part
+    holding an element by bisection. The lengths of the parts are only computed
+    when first needed, and again if the number of parts changes.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+        self._lengths = [None] * len(parts)
+        self._ends = None
+
+    def invalidate(self):
+        self._lengths = [None] * len(self.parts)
+        self._ends = None
+
+    def length(self, i):
+        """Length of part `i`, without computing the lengths of the other parts"""
+        if len(self._lengths) != len(self.parts):
+            self.invalidate()
+        if self._lengths[i] is None:
+            self._lengths[i] = len(self.parts[i])
+        return self._lengths[i]
+
+    @property
+    def ends(self):
+        """Position after the last element of each part"""
+        if self._ends is None or len(self._ends) != len(self.parts):
+            if len(self._lengths) != len(self.parts):
+                self.invalidate()
+            self._compute_lengths()
+            self._ends = list(itertools.accumulate(self._lengths))
+        return self._ends
+
+    def _compute_lengths(self):
+        todo = [i for i, n in enumerate(self._lengths) if n is None]
+
+        max_workers = SETTINGS.get("number-of-length-threads")
+        if max_workers <= 0:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, len(todo))
+
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                lengths = list(pool.map(lambda i: len(self.parts[i]), todo))
+        else:
+            lengths = [len(self.parts[i]) for i in todo]
+
+        for i, n in zip(todo, lengths):
+            self._lengths[i] = n
+
+    def __len__(self):
+        ends = self.ends
+        return ends[-1] if ends else 0
+
+    def locate(self, n):
+        """Returns the part holding element `n` and the position of the element
+        in that part
+        """
+        ends = self.ends
+        total = ends[-1] if ends else 0
+
+        if n < 0:
+            n += total
+        if not 0 <= n < total:
+            raise IndexError(n)
+
+        # Empty parts have the same end as the previous part, and are skipped
+        i = bisect.bisect_right(ends, n)
+        return i, n - (ends[i - 1] if i else 0)
@@ -6,11 +6,17 @@
 # granted to it by virtue of its status as an intergovernmental organisation
 # nor does it submit to any jurisdiction.
 
+import logging
 import os
 from collections import defaultdict
 
 from climetlab.utils import download_and_cache
 
+LOG = logging.getLogger(__name__)
+
+# Size of the reads when the data cannot be copied by the kernel
+BLOCK_SIZE = 16 * 1024 * 1024
+
 
 class Part:
     def __init__(self, path, offset, length):
@@ -55,3 +61,87 @@ class Part:
 
     def __repr__(self):
         return f"Part[{self.path},{self.offset},{self.length}]"
+
+
+def coalesce_parts(parts):
+    """Merges consecutive parts of the same file that are adjacent, keeping their order"""
+    result = []
+    for part in parts:
+        last = result[-1] if result else None
+        if (
+            last is not None
+            and last.path == part.path
+            and last.offset + last.length == part.offset
+        ):
+            result[-1] = Part(last.path, last.offset, last.length + part.length)
+        else:
+            result.append(Part(part.path, part.offset, part.length))
+    return result
+
+
+def _copy_in_kernel(source, target, offset, length):
+    # Returns the number of bytes copied without going through user space
+    for name in ("copy_file_range", "sendfile"):
+        copy = getattr(os, name, None)
+        if copy is None:
+            continue
+
+        copied = 0
+        try:
+            while copied < length:
+                if name == "copy_file_range":
+                    n = copy(source, target, length - copied, offset + copied)
+                else:
+                    n = copy(target, source, offset + copied, length - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            # Not supported by the platform or the file systems
+            LOG.debug("%s: %s", name, e)
+
+        if copied:
+            return copied
+
+    return 0
+
+
+def copy_parts(parts, f):
+    """Writes the bytes of `parts` to the file object `f`, in order. Adjacent parts
+    are copied at once, by the kernel if `f` is a file, otherwise by large reads.
+    """
+    try:
+        # The position of `f` is updated after each copy
+        target = f.fileno() if f.seekable() else None
+    except (AttributeError, OSError):
+        target = None
+
+    files = {}
+    try:
+        for part in coalesce_parts(parts):
+            if part.path not in files:
+                files[part.path] = open(part.path, "rb")
+            source = files[part.path]
+
+            offset, length = part.offset, part.length
+
+            if target is not None and length > 0:
+                f.flush()
+                copied = _copy_in_kernel(source.fileno(), target, offset, length)
+                if copied:
+                    f.seek(os.lseek(target, 0, os.SEEK_CUR))
+                    offset += copied
+                    length -= copied
+
+            source.seek(offset)
+            while length > 0:
+                data = source.read(min(length, BLOCK_SIZE))
+                if not data:
+                    raise EOFError(
+                        f"{part.path}: cannot read {length} bytes at {offset}"
+                    )
+                f.write(data)
+                length -= len(data)
+    finally:
+        for file in files.values():
+            file.close()
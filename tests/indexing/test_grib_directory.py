@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+import shutil
+
+import pytest
+
+from climetlab.core.settings import SETTINGS
+from climetlab.core.temporary import temp_directory
+from climetlab.indexing.database.sql import PathTable, SqlDatabase
+from climetlab.readers.grib.parsing import GribIndexingDirectoryParserIterator
+from climetlab.testing import climetlab_file
+
+TEST4 = climetlab_file("docs/examples/test4.grib")
+LENGTH = 130428  # Length of the messages of test4.grib
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_grib_indexing_directory(workers):
+    with temp_directory() as tmpdir:
+        data = os.path.join(tmpdir, "data")
+        os.mkdir(data)
+        for name in ("a", "b", "c"):
+            shutil.copyfile(TEST4, os.path.join(data, f"{name}.grib"))
+        with open(os.path.join(data, "d.grib"), "wb") as f:
+            f.write(b"not a grib file")
+        # e.grib ends in the middle of its first message
+        with open(TEST4, "rb") as f:
+            truncated = f.read(1000)
+        with open(os.path.join(data, "e.grib"), "wb") as f:
+            f.write(truncated)
+
+        db_path = os.path.join(tmpdir, "index.db")
+        parser = GribIndexingDirectoryParserIterator(
+            data,
+            db_path=db_path,
+            relative_paths=True,
+        )
+        with SETTINGS.temporary("number-of-grib-indexing-workers", workers):
+            with SETTINGS.temporary("number-of-entries-per-insert", 5):
+                # The error is raised once the other files are loaded
+                with pytest.raises(ValueError, match="e.grib"):
+                    parser.load_database()
+
+        db = SqlDatabase(db_path)
+        assert db.count() == 12
+        # In the order of the files
+        assert [(p.path, p.offset) for p in db.lookup_parts(resolve_paths=False)] == [
+            (name, i * LENGTH)
+            for name in ("a.grib", "b.grib", "c.grib")
+            for i in range(4)
+        ]
+        assert db.already_loaded("c.grib", None)
+        assert not db.already_loaded("e.grib", None)
+
+        # Files already loaded are skipped, the ones that failed are parsed again
+        shutil.copyfile(TEST4, os.path.join(data, "e.grib"))
+        parser.load_database()
+        assert SqlDatabase(db_path).count() == 16
+
+
+def test_grib_reindexing_directory():
+    def files(db):
+        return [(p.path, p.offset) for p in db.lookup_parts(resolve_paths=False)]
+
+    def dates(db):
+        return dict(db.connection.execute("SELECT key, date FROM paths;").fetchall())
+
+    with temp_directory() as tmpdir:
+        data = os.path.join(tmpdir, "data")
+        os.mkdir(data)
+        for name in ("a", "b", "c", "e"):
+            shutil.copyfile(TEST4, os.path.join(data, f"{name}.grib"))
+
+        db_path = os.path.join(tmpdir, "index.db")
+        GribIndexingDirectoryParserIterator(
+            data, db_path=db_path, relative_paths=True
+        ).load_database()
+
+        db = SqlDatabase(db_path)
+        assert db._version == db.VERSION
+        stats = db.paths_stats()
+        st = os.stat(os.path.join(data, "a.grib"))
+        assert stats["a.grib"] == (st.st_size, st.st_mtime, st.st_ino)
+        before = dates(db)
+
+        # b.grib only has its first message, c.grib is removed, d.grib is new
+        # and e.grib now ends in the middle of its first message
+        with open(TEST4, "rb") as f:
+            first = f.read(LENGTH)
+        with open(os.path.join(data, "b.grib"), "wb") as f:
+            f.write(first)
+        os.unlink(os.path.join(data, "c.grib"))
+        shutil.copyfile(TEST4, os.path.join(data, "d.grib"))
+        with open(os.path.join(data, "e.grib"), "wb") as f:
+            f.write(first[:1000])
+
+        # Without reindex, only new files are loaded
+        GribIndexingDirectoryParserIterator(
+            data, db_path=db_path, relative_paths=True
+        ).load_database()
+        assert len(files(SqlDatabase(db_path))) == 20
+
+        with pytest.raises(ValueError, match="e.grib"):
+            GribIndexingDirectoryParserIterator(
+                data, db_path=db_path, relative_paths=True, reindex=True
+            ).load_database()
+
+        db = SqlDatabase(db_path)
+        assert sorted(files(db)) == sorted(
+            [("a.grib", i * LENGTH) for i in range(4)]
+            + [("b.grib", 0)]
+            + [("d.grib", i * LENGTH) for i in range(4)]
+            + [("e.grib", i * LENGTH) for i in range(4)]
+        )
+        after = dates(db)
+        assert sorted(after) == ["a.grib", "b.grib", "d.grib", "e.grib"]
+        # a.grib has not been loaded again
+        assert after["a.grib"] == before["a.grib"]
+        assert after["b.grib"] != before["b.grib"]
+        # The entries of e.grib are kept until it can be parsed
+        assert after["e.grib"] == before["e.grib"]
+
+        # Paths tables created by previous versions have no stats
+        with db.connection as connection:
+            connection.execute("DROP TABLE paths;")
+            connection.execute("CREATE TABLE paths (key TEXT PRIMARY KEY, date TEXT);")
+            connection.execute("INSERT INTO paths VALUES ('a.grib', 'x');")
+            PathTable(connection).ensure_table()
+        assert db.paths_stats() == {"a.grib": (None, None, None)}
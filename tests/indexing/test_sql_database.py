@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2020 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+
+import pytest
+
+from climetlab.core.settings import SETTINGS
+from climetlab.core.temporary import temp_directory
+from climetlab.indexing.database.sql import SqlDatabase
+
+
+def entries():
+    for i in range(7):
+        entry = dict(_path="a.grib", _offset=i * 10, _length=10, param="t", step=i)
+        if i >= 3:
+            # New keys in the middle of a batch
+            entry["levelist"] = 500 + i
+        if i == 5:
+            entry["number"] = 1
+        yield entry
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+@pytest.mark.parametrize("fast", [False, True])
+def test_sql_database_load(batch_size, fast):
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test.db")
+        with SETTINGS.temporary("number-of-entries-per-insert", batch_size):
+            with SETTINGS.temporary("use-fast-sqlite-loading", fast):
+                db = SqlDatabase(path)
+                assert db.load_iterator(entries()) == 7
+
+        assert list(db.lookup_dicts()) == list(entries())
+        assert db.already_loaded("a.grib", None)
+
+        # Pragmas of the connection are restored after the load
+        assert db.connection.execute("PRAGMA synchronous;").fetchone()[0] == 2
+
+        db.build_indexes()
+        assert db.count() == 7
+
+
+def test_sql_database_upgrade():
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test.db")
+        db = SqlDatabase(path)
+        db.load_iterator(entries())
+
+        # Version 6 had no stats in the paths table
+        with db.connection as connection:
+            connection.execute("DROP TABLE paths;")
+            connection.execute("CREATE TABLE paths (key TEXT PRIMARY KEY, date TEXT);")
+            connection.execute("INSERT INTO paths VALUES ('a.grib', 'x');")
+            connection.execute("PRAGMA user_version = 6;")
+
+        db = SqlDatabase(path)
+        entry = dict(_path="b.grib", _offset=0, _length=10, param="z", step=0)
+        assert db.load_iterator([entry], stats={"b.grib": (10, 1.5, 2)}) == 1
+        assert db._version == db.VERSION
+        assert db.paths_stats() == {
+            "a.grib": (None, None, None),
+            "b.grib": (10, 1.5, 2),
+        }
+
+        # Older versions cannot be upgraded
+        with db.connection as connection:
+            connection.execute("PRAGMA user_version = 5;")
+        with pytest.raises(Exception, match="cannot be upgraded"):
+            SqlDatabase(path).load_iterator([entry])
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+
+import eccodes
+import pytest
+
+from climetlab.core.temporary import temp_directory
+from climetlab.readers.grib.headers import HeadersParser
+from climetlab.readers.grib.parsing import _index_grib_file
+from climetlab.testing import climetlab_file
+
+
+def _encode(path, edition, ensemble, bitmap):
+    handles = []
+    with open(climetlab_file("docs/examples/test4.grib"), "rb") as f:
+        while True:
+            h = eccodes.codes_new_from_file(f, eccodes.CODES_PRODUCT_GRIB)
+            if h is None:
+                break
+            handles.append(h)
+
+    with open(path, "wb") as f:
+        for step in (0, 6, 12):
+            for number in (1, 2) if ensemble else (None,):
+                for date in (20070101, 20070102):
+                    for h in handles:
+                        h = eccodes.codes_clone(h)
+                        if edition == 2:
+                            eccodes.codes_set_long(h, "edition", 2)
+                        if number is not None and edition == 1:
+                            eccodes.codes_set_long(h, "localDefinitionNumber", 1)
+                            eccodes.codes_set_string(h, "stream", "enfo")
+                            eccodes.codes_set_string(h, "type", "pf")
+                            eccodes.codes_set_long(h, "number", number)
+                        if number is not None and edition == 2:
+                            eccodes.codes_set_long(
+                                h, "productDefinitionTemplateNumber", 1
+                            )
+                            eccodes.codes_set_long(h, "perturbationNumber", number)
+                        eccodes.codes_set_long(h, "date", date)
+                        eccodes.codes_set_long(h, "step", step)
+                        if bitmap:
+                            eccodes.codes_set_long(h, "bitmapPresent", 1)
+                            values = eccodes.codes_get_values(h)
+                            values[::5] = eccodes.codes_get_double(h, "missingValue")
+                            eccodes.codes_set_values(h, values)
+                        eccodes.codes_write(h, f)
+                        eccodes.codes_release(h)
+
+    for h in handles:
+        eccodes.codes_release(h)
+
+
+@pytest.mark.parametrize("edition", [1, 2])
+@pytest.mark.parametrize("ensemble", [False, True])
+@pytest.mark.parametrize("bitmap", [False, True])
+def test_native_grib_header_parser(edition, ensemble, bitmap):
+    with temp_directory() as tmp:
+        path = os.path.join(tmp, "data.grib")
+        _encode(path, edition, ensemble, bitmap)
+
+        for with_statistics in (False, True):
+            expected = list(
+                _index_grib_file(path, with_statistics=with_statistics, native=False)
+            )
+            fields = list(
+                _index_grib_file(path, with_statistics=with_statistics, native=True)
+            )
+            assert len(fields) == (48 if ensemble else 24)
+            assert fields == expected
+
+
+def test_native_grib_header_parser_templates():
+    decoded = []
+
+    def decode(message):
+        decoded.append(message)
+        return dict(levelist=levelist, count=len(decoded))
+
+    with open(climetlab_file("docs/examples/test4.grib"), "rb") as f:
+        message = f.read(130428)
+
+    # The keys of the first message of the template are reused
+    levelist = 500
+    parser = HeadersParser(decode)
+    for i in range(3):
+        field, headers = parser.parse(message)
+        assert field == dict(levelist=500, count=1)
+        assert headers.keys["levelist"] == 500
+    assert (parser.decoded, parser.parsed) == (1, 2)
+
+    # The keys of eccodes do not match the ones read from the headers,
+    # so all the messages of that template are decoded by eccodes
+    levelist = 850
+    parser = HeadersParser(decode)
+    for i in range(3):
+        field, headers = parser.parse(message)
+        assert field == dict(levelist=850, count=i + 2)
+    assert (parser.decoded, parser.parsed) == (3, 0)
+
+    # Unsupported messages
+    field, headers = parser.parse(b"not a GRIB message")
+    assert headers is None
+    assert parser.decoded == 4
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
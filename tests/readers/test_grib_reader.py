@@ -10,11 +10,31 @@
 #
 
 import datetime
+import json
 import os
+import shutil
 
+import numpy as np
 import pytest
 
 from climetlab import load_source, plot_map
+from climetlab.core.caching import auxiliary_cache_file_path
+from climetlab.core.settings import SETTINGS
+from climetlab.core.temporary import temp_directory, temp_file
+from climetlab.readers.grib.codes import (
+    CodesHandle,
+    ReaderLRUCache,
+    get_messages_positions,
+    scan_messages_positions,
+)
+from climetlab.readers.grib.index.file import (
+    FieldSetInOneFile,
+    metadata_sidecar_path,
+    positions_index_path,
+    read_metadata_sidecar,
+    read_positions_index,
+)
+from climetlab.readers.grib.memory import MEMORY
 from climetlab.testing import NO_CDS, climetlab_file
 
 
@@ -103,6 +123,784 @@ def test_bbox():
     assert s.to_bounding_box().as_tuple() == (73, -27, 33, 45), s.to_bounding_box()
 
 
+def test_scan_messages_positions():
+    for name in ("test.grib", "test4.grib"):
+        path = climetlab_file("docs/examples", name)
+        offsets, lengths = scan_messages_positions(path)
+        expected = list(get_messages_positions(path))
+        assert list(zip(offsets.tolist(), lengths.tolist())) == expected
+
+
+def test_scan_messages_positions_mixed():
+    with open(climetlab_file("docs/examples/test.grib"), "rb") as f:
+        grib1 = f.read()
+
+    with temp_file() as grib2_path:
+        CodesHandle.from_sample("GRIB2").save(grib2_path)
+        with open(grib2_path, "rb") as f:
+            grib2 = f.read()
+
+    with temp_file() as path:
+        with open(path, "wb") as f:
+            f.write(b"garbage")
+            f.write(grib1)
+            f.write(b"GRI")
+            f.write(grib2)
+            f.write(b"trailing")
+
+        offsets, lengths = scan_messages_positions(path)
+        assert offsets.tolist() == [7, 533, 7 + len(grib1) + 3]
+        assert lengths.tolist() == [526, 526, len(grib2)]
+        assert list(zip(offsets.tolist(), lengths.tolist())) == list(
+            get_messages_positions(path)
+        )
+
+    with temp_file() as path:
+        open(path, "wb").close()
+        offsets, lengths = scan_messages_positions(path)
+        assert len(offsets) == 0 and len(lengths) == 0
+
+
+def test_grib_index_sidecar():
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test4.grib")
+        shutil.copyfile(climetlab_file("docs/examples/test4.grib"), path)
+
+        offsets, lengths = scan_messages_positions(path)
+
+        fs = FieldSetInOneFile(path)
+        assert len(fs) == 4
+        assert fs.part(3).offset == offsets[3]
+        assert fs.part(3).length == lengths[3]
+
+        stored = read_positions_index(fs.mappings_cache_file)
+        assert stored[0].tolist() == offsets.tolist()
+        assert stored[1].tolist() == lengths.tolist()
+
+        # Reopening uses the sidecar
+        fs = FieldSetInOneFile(path)
+        assert isinstance(fs.offsets, np.memmap)
+        assert len(fs) == 4
+
+
+def test_grib_index_legacy_json():
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test4.grib")
+        shutil.copyfile(climetlab_file("docs/examples/test4.grib"), path)
+
+        legacy = auxiliary_cache_file_path("grib-index", path, extension=".json")
+        with open(legacy, "w") as f:
+            json.dump(dict(version=1, offsets=[0, 10], lengths=[10, 20]), f)
+
+        fs = FieldSetInOneFile(path)
+        assert len(fs) == 2
+        assert fs.part(1).offset == 10
+        assert fs.part(1).length == 20
+
+
+def test_grib_index_many_files():
+    with temp_directory() as tmpdir:
+        paths = []
+        for i in range(6):
+            path = os.path.join(tmpdir, f"{i}.grib")
+            name = "test4.grib" if i % 2 else "test.grib"
+            shutil.copyfile(climetlab_file("docs/examples", name), path)
+            paths.append(path)
+
+        fieldsets = FieldSetInOneFile.from_paths(paths, max_workers=3)
+        assert [f.path for f in fieldsets] == paths
+        assert [len(f) for f in fieldsets] == [2, 4, 2, 4, 2, 4]
+        assert all(os.path.exists(positions_index_path(p)) for p in paths)
+
+        ds = load_source("file", tmpdir)
+        assert len(ds) == 18
+
+
+def _grib2_copy(path, target):
+    import eccodes
+
+    with open(path, "rb") as f, open(target, "wb") as g:
+        while True:
+            h = eccodes.codes_new_from_file(f, eccodes.CODES_PRODUCT_GRIB)
+            if h is None:
+                break
+            eccodes.codes_set_long(h, "edition", 2)
+            g.write(eccodes.codes_get_message(h))
+            eccodes.codes_release(h)
+
+
+@pytest.mark.parametrize("edition", [1, 2])
+def test_grib_get_many_types(edition):
+    from climetlab.readers.grib.codes import KEY_TYPES
+
+    with temp_directory() as tmpdir:
+        path = climetlab_file("docs/examples/test4.grib")
+        if edition == 2:
+            _grib2_copy(path, os.path.join(tmpdir, "test4.grib2"))
+            path = os.path.join(tmpdir, "test4.grib2")
+
+        keys = list(KEY_TYPES) + ["param"]
+        for f in load_source("file", path):
+            handle = f.handle
+            assert handle.get("edition") == edition
+            expected = {k: handle.get(k) for k in keys}
+            result = handle.get_many(keys)
+            # Same values, with the same types
+            assert result == expected
+            assert {k: type(v) for k, v in result.items()} == {
+                k: type(v) for k, v in expected.items()
+            }
+
+
+def test_grib_get_many():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    keys = ["shortName", "level", "levelist", "date", "md5GridSection", "foo"]
+
+    for f in s:
+        handle = f.handle
+        expected = {k: handle.get(k) for k in keys}
+        assert handle.get_many(keys) == expected
+        assert handle.get_many(keys, types=[str, int, int, int, None, None]) == expected
+
+    f = s[0]
+    f.prefetch_metadata(["param", "level", "valid_datetime"])
+    assert set(f._cache) == {"shortName", "level", "validityDate", "validityTime"}
+    assert f.metadata("param") == "t"
+    assert f.metadata("valid_datetime") == "2007-01-01T12:00:00"
+
+    assert len(s.sel(param="t", level=500)) == 1
+    assert s.unique_values("param", "level", progress_bar=False) == {
+        "param": ("t", "z"),
+        "level": (500, 850),
+    }
+
+
+def test_grib_fields_memory():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = [f.to_numpy() for f in s]
+    size = expected[0].nbytes
+
+    with SETTINGS.temporary("maximum-grib-fields-memory", str(size * 2 + 1024)):
+        fields = list(s)
+        before = MEMORY.statistics()
+
+        for f in fields:
+            f.values
+        assert MEMORY.statistics()["size"] <= size * 2 + 1024
+        assert MEMORY.statistics()["evictions"] > before["evictions"]
+
+        # Only the most recently used values are kept
+        assert fields[0]._values is None
+        assert fields[-1]._values is not None
+
+        hits = MEMORY.statistics()["hits"]
+        fields[-1].values
+        assert MEMORY.statistics()["hits"] == hits + 1
+
+        # Evicted values are decoded again
+        for f, e in zip(fields, expected):
+            assert (f.to_numpy() == e).all()
+
+        del fields
+        assert MEMORY.statistics()["size"] <= size * 2 + 1024
+
+    # Nothing is counted when the memory is not limited
+    with SETTINGS.temporary("maximum-grib-fields-memory", None):
+        before = MEMORY.statistics()
+        for f in s:
+            f.values
+            f.values
+        after = MEMORY.statistics()
+        assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+
+
+def test_grib_readers_cache():
+    paths = [climetlab_file("docs/examples", n) for n in ("test.grib", "test4.grib")]
+    paths.append(climetlab_file("climetlab/sources/dummy.grib"))
+
+    cache = ReaderLRUCache(2)
+    a = cache[paths[0]]
+    assert cache[paths[0]] is a
+    cache[paths[1]]
+    cache[paths[0]]
+    cache[paths[2]]  # Evicts paths[1], the least recently used
+
+    assert list(cache.readers) == [paths[0], paths[2]]
+    assert cache.statistics() == dict(hits=2, misses=3, evictions=1, open=2, size=2)
+
+    # Simulate a fork
+    cache.pid = -1
+    assert cache[paths[0]] is not a
+    assert len(cache) == 1
+
+
+def test_grib_concurrent_reads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = [f.to_numpy() for f in s]
+
+    def decode(i):
+        return s[i % len(s)].to_numpy()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(decode, range(32)))
+
+    for i, r in enumerate(results):
+        assert (r == expected[i % len(s)]).all()
+
+    with temp_file() as path:
+        s.save(path)
+        with open(path, "rb") as f, open(s.path, "rb") as g:
+            assert f.read() == g.read()
+
+
+def test_grib_to_numpy_preallocated():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = np.stack([f.to_numpy() for f in s])
+
+    a = s.to_numpy()
+    assert a.shape == (4,) + s[0].shape
+    assert a.dtype == np.float64
+    assert (a == expected).all()
+
+    a = s.to_numpy(dtype=np.float32)
+    assert a.dtype == np.float32
+    assert np.allclose(a, expected.astype(np.float32))
+
+    out = np.zeros(expected.shape, dtype=np.float32)
+    assert s.to_numpy(out=out) is out
+    assert np.allclose(out, expected.astype(np.float32))
+
+    with pytest.raises(ValueError):
+        s.to_numpy(out=np.zeros((3,) + s[0].shape))
+
+    cube = s.cube("param", "level")
+    a = cube.to_numpy()
+    assert a.shape == (2, 2) + s[0].shape
+
+    out = np.zeros(cube.extended_user_shape)
+    assert cube.to_numpy(out=out) is out
+    assert (out == a).all()
+
+
+@pytest.mark.parametrize("parallel", [True, "threads", "processes"])
+def test_grib_to_numpy_parallel(parallel):
+    s = load_source(
+        "multi",
+        load_source("file", climetlab_file("docs/examples/test4.grib")),
+        load_source("file", climetlab_file("docs/examples/test4.grib")).sel(param="z"),
+    )
+    expected = s.to_numpy(dtype=np.float32)
+
+    a = s.to_numpy(parallel=parallel, max_workers=2, dtype=np.float32)
+    assert a.dtype == np.float32
+    assert a.tobytes() == expected.tobytes()
+    # The processes decode directly in the array returned
+    assert a.flags.owndata == (parallel != "processes")
+
+    out = np.zeros(expected.shape)
+    assert s.to_numpy(parallel=parallel, out=out) is out
+    assert out.tobytes() == s.to_numpy().tobytes()
+
+    with pytest.raises(ValueError):
+        s.to_numpy(parallel="gpu")
+
+
+@pytest.mark.parametrize("parallel", [False, "threads"])
+def test_grib_to_numpy_dtype(monkeypatch, parallel):
+    from climetlab.readers.grib import simple
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.to_numpy()
+
+    # The fields are decoded directly to the type requested
+    dtypes = []
+    decode_simple_packing = simple.decode_simple_packing
+
+    def recording(field, dtype=np.float64):
+        dtypes.append(np.dtype(dtype))
+        return decode_simple_packing(field, dtype)
+
+    monkeypatch.setattr(simple, "decode_simple_packing", recording)
+
+    with SETTINGS.temporary("use-numpy-grib-decoder", True):
+        a = s.to_numpy(dtype=np.float32, parallel=parallel)
+    assert a.dtype == np.float32
+    assert dtypes == [np.float32] * len(s)
+    assert np.allclose(a, expected, rtol=1e-6)
+
+
+def test_grib_parallel_incomplete_parts(monkeypatch):
+    from climetlab.readers.grib import parallel, statistics
+    from climetlab.readers.grib.codes import GribField
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.to_numpy()
+
+    # Fields whose length is unknown are decoded in this process
+    def fail(*args, **kwargs):
+        raise AssertionError("Fields decoded in other processes")
+
+    monkeypatch.setattr(parallel, "ProcessPoolExecutor", fail)
+    monkeypatch.setattr(statistics, "ProcessPoolExecutor", fail)
+
+    fields = [GribField(f.path, f.offset, None) for f in s]
+    a = parallel.decode_fields(fields, "processes", max_workers=2)
+    assert (a == expected).all()
+
+    m = statistics.fields_moments(fields, "processes", max_workers=2)
+    assert m.count == expected.size
+    assert np.isclose(m.mean, expected.mean(), rtol=1e-12)
+
+
+@pytest.mark.parametrize("persist", [False, True])
+def test_grib_grid_points(persist):
+    from climetlab.readers.grib.geometry import GEOMETRY
+
+    GEOMETRY.clear()
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    data = s[0].data
+    expected_lat = np.array([d["lat"] for d in data])
+    expected_lon = np.array([d["lon"] for d in data])
+
+    with SETTINGS.temporary("cache-grib-geometry", persist):
+        lat, lon = s[0].grid_points()
+        assert (lat == expected_lat).all()
+        assert (lon == expected_lon).all()
+        assert not lat.flags.writeable
+
+        # Fields on the same grid share the same arrays
+        lat2, lon2 = s[3].grid_points()
+        assert lat2 is lat and lon2 is lon
+        assert GEOMETRY.statistics()["hits"] >= 1
+
+    assert list(s[0].iterate_grid_points())[:3] == list(
+        zip(expected_lat[:3], expected_lon[:3])
+    )
+
+
+def test_grib_to_pandas():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    df = s.to_pandas()
+    assert len(df) == 4 * 181 * 360
+    assert list(df.columns[:4]) == ["lat", "lon", "value", "datetime"]
+    assert (df["value"].values == s.to_numpy().ravel()).all()
+    assert list(df["param"].unique()) == ["t", "z"]
+
+    # Nearest grid point
+    df = s.to_pandas(latitude=50.3, longitude=-349.8)
+    assert len(df) == 4
+    assert (df["lat"] == 50).all() and (df["lon"] == 10).all()
+    assert list(df["value"]) == [f.to_numpy()[40, 10] for f in s]
+
+
+def test_grib_to_pandas_one_pass(monkeypatch):
+    from climetlab.readers.grib.index import FieldSetInFiles
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.to_pandas()
+
+    # Each field is only created (and decoded) once
+    count = [0]
+    getitem = FieldSetInFiles._getitem
+
+    def counting(self, n):
+        field = getitem(self, n)
+        count[0] += 1
+        return field
+
+    monkeypatch.setattr(FieldSetInFiles, "_getitem", counting)
+    df = s.to_pandas()
+
+    assert count[0] == len(s)
+    assert df.equals(expected)
+
+
+@pytest.mark.parametrize("parallel", [False, "threads", "processes"])
+def test_grib_statistics(monkeypatch, parallel):
+    with temp_directory() as tmp:
+        path = os.path.join(tmp, "test4.grib")
+        shutil.copy(climetlab_file("docs/examples/test4.grib"), path)
+
+        s = load_source("file", path).sel(param="t")
+        values = s.to_numpy()
+        stats = s.statistics(parallel=parallel, max_workers=2)
+        assert stats["count"] == 2
+        assert stats["minimum"] == values.min()
+        assert stats["maximum"] == values.max()
+        assert np.isclose(stats["average"], values.mean(), rtol=1e-12)
+        assert np.isclose(stats["stdev"], values.std(), rtol=1e-12)
+
+        # The results are kept in the cache
+        from climetlab.readers.grib import statistics
+
+        def fail(field):
+            raise AssertionError("Statistics computed again")
+
+        monkeypatch.setattr(statistics, "field_moments", fail)
+        assert load_source("file", path).sel(param="t").statistics() == stats
+
+
+def test_grib_statistics_moments():
+    from climetlab.readers.grib.statistics import Moments
+
+    m = Moments.from_values([1.0, np.nan, 9999, 3.0], missing_value=9999)
+    assert (m.count, m.mean, m.stdev, m.minimum, m.maximum) == (2, 2.0, 1.0, 1.0, 3.0)
+
+    # Merging the moments of chunks gives the moments of all the values
+    values = np.random.default_rng(0).normal(1e4, 10, 1000)
+    m = Moments()
+    for chunk in np.array_split(values, 7):
+        m.merge(Moments.from_values(chunk))
+    assert m.count == 1000
+    assert np.isclose(m.mean, values.mean(), rtol=1e-14)
+    assert np.isclose(m.stdev, values.std(), rtol=1e-10)
+    assert (m.minimum, m.maximum) == (values.min(), values.max())
+
+    assert Moments().merge(Moments.from_values([np.nan])).count == 0
+
+
+@pytest.mark.parametrize("kernel", [True, False])
+def test_grib_save_selection(monkeypatch, kernel):
+    import io
+
+    from climetlab.utils import parts
+
+    path = climetlab_file("docs/examples/test4.grib")
+    with open(path, "rb") as f:
+        data = f.read()
+    messages = [data[i * 130428 : (i + 1) * 130428] for i in range(4)]
+
+    test4 = load_source("file", path)
+    ds = load_source(
+        "multi",
+        test4,
+        test4.sel(param="z"),
+        test4.order_by(level=[850, 500]),
+    )
+    # t500, z500, t850, z850, then z500, z850, then t850, z850, t500, z500
+    expected = b"".join(messages[i] for i in (0, 1, 2, 3, 1, 3, 2, 3, 0, 1))
+
+    if not kernel:
+        monkeypatch.setattr(parts, "_copy_in_kernel", lambda *args: 0)
+
+    with temp_directory() as tmp:
+        target = os.path.join(tmp, "out.grib")
+        with open(target, "wb") as f:
+            f.write(b"head")
+            ds.write(f)
+            f.write(b"tail")
+        with open(target, "rb") as f:
+            assert f.read() == b"head" + expected + b"tail"
+
+        ds.save(target)
+        with open(target, "rb") as f:
+            assert f.read() == expected
+
+    f = io.BytesIO()
+    ds.write(f)
+    assert f.getvalue() == expected
+
+    # Adjacent messages of the same file are copied at once
+    coalesced = parts.coalesce_parts(
+        [parts.Part(path, i * 130428, 130428) for i in (0, 1, 2, 0, 3)]
+    )
+    assert [(p.offset, p.length) for p in coalesced] == [
+        (0, 3 * 130428),
+        (0, 130428),
+        (3 * 130428, 130428),
+    ]
+
+
+def test_grib_metadata_table(monkeypatch):
+    from climetlab.readers.grib.index import FieldSetInFiles
+
+    def fields(ds):
+        return [(f.metadata("param"), f.metadata("level"), f.offset) for f in ds]
+
+    def queries(test4):
+        ds = load_source("multi", test4, test4.order_by(level="descending"))
+        return [
+            ds.sel(param="t"),
+            ds.sel(param=["z", "t"], level=850),
+            ds.sel(level=lambda x: x > 600),
+            ds.sel(param="q"),
+            ds.sel(param_level="t850", remapping={"param_level": "{param}{levelist}"}),
+            ds.order_by("level", param="descending"),
+            ds.order_by(param=["z", "t"], level="ascending"),
+            ds.order_by("param_level", remapping={"param_level": "{param}{levelist}"}),
+            ds.sel(param="z").order_by(level="descending")[1:],
+        ]
+
+    path = climetlab_file("docs/examples/test4.grib")
+    results = [fields(ds) for ds in queries(load_source("file", path))]
+
+    # Same results when the fields are matched and compared one by one
+    for c in (FieldSetInFiles, FieldSetInOneFile):
+        monkeypatch.setattr(c, "_metadata_table", lambda self: None)
+    expected = [fields(ds) for ds in queries(load_source("file", path))]
+
+    assert results == expected
+    assert results[1] == [("t", 850, 2 * 130428), ("z", 850, 3 * 130428)] * 2
+    assert results[3] == []
+
+
+def test_grib_metadata_table_of_slices(monkeypatch):
+    from climetlab.readers.grib.codes import GribField
+
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test4.grib")
+        shutil.copyfile(climetlab_file("docs/examples/test4.grib"), path)
+        s = load_source("file", path)
+
+        # Only the metadata of the elements of the slices is read
+        count = [0]
+        metadata = GribField.metadata
+
+        def counting(self, *args, **kwargs):
+            count[0] += 1
+            return metadata(self, *args, **kwargs)
+
+        with monkeypatch.context() as m:
+            m.setattr(GribField, "metadata", counting)
+            assert len(s[:1].sel(param="t")) == 1
+            assert count[0] == 1
+
+            count[0] = 0
+            ds = load_source("multi", s[:1], s[2:3])
+            assert [f.offset for f in ds.sel(param="t", level=850)] == [2 * 130428]
+            assert count[0] == 4
+
+        # Columns already loaded are shared with the slices
+        s.sel(param="t")
+        count[0] = 0
+        monkeypatch.setattr(GribField, "metadata", counting)
+        assert len(s[1:].sel(param="z")) == 2
+        assert count[0] == 0
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(level="descending"),
+        dict(param=["z", "t"], level="ascending"),
+        dict(level=[850, "500"], param="descending"),
+        dict(param=lambda a, b: len(a) - len(b)),
+    ],
+)
+def test_grib_order_by_keys(kwargs):
+    import functools
+
+    from climetlab.core.index import Order
+    from climetlab.core.order import build_remapping
+
+    test4 = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    ds = load_source("multi", test4, test4.sel(param="z"))
+
+    # Same order as when sorting with pairwise comparisons of the fields
+    order = Order(ds._normalize_kwargs_names(**kwargs), build_remapping(None))
+    expected = sorted(
+        range(len(ds)),
+        key=functools.cmp_to_key(lambda i, j: order.compare_elements(ds[i], ds[j])),
+    )
+
+    assert [f.offset for f in ds.order_by(**kwargs)] == [ds[i].offset for i in expected]
+
+
+def test_grib_mask_index_chain():
+    test4 = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    ds = test4.order_by(level="descending")
+    ds = ds[(3, 2, 1, 0)][1:]
+    ds = ds.sel(param="t")
+    ds = ds[[False, True]]
+
+    # Only one level of indices, pointing to the file
+    assert ds.index is test4
+    assert ds.indices.dtype == np.int64
+    assert ds.indices.tolist() == [2]
+    assert [(f.metadata("param"), f.metadata("level")) for f in ds] == [("t", 850)]
+
+
+def test_grib_full_index():
+    test4 = load_source("file", climetlab_file("docs/examples/test4.grib"))
+
+    def fields(ds):
+        return [
+            None if f is None else (f.metadata("param"), f.metadata("level"))
+            for f in ds
+        ]
+
+    ds = test4[(0, 1, 3)].full("param", "levelist")
+    assert len(ds) == 4
+    assert ds.shape == (2, 2)
+    assert fields(ds) == [("t", 500), None, ("z", 500), ("z", 850)]
+
+    # The elements do not need to be in the order of the hypercube
+    ds = test4.order_by(level="descending").full("param", "levelist")
+    assert fields(ds) == [("t", 850), ("t", 500), ("z", 850), ("z", 500)]
+
+
+def test_grib_full_index_to_numpy():
+    test4 = load_source("file", climetlab_file("docs/examples/test4.grib"))
+
+    # ("t", 850) is missing, its values are NaN
+    ds = test4[(0, 1, 3)].full("param", "levelist")
+    values = ds.to_numpy()
+    assert values.shape == (4,) + test4[0].shape
+    assert np.isnan(values[1]).all()
+    for i, j in ((0, 0), (2, 1), (3, 3)):
+        assert (values[i] == test4[j].to_numpy()).all()
+
+    with pytest.raises(ValueError):
+        ds.to_numpy(dtype=np.int32)
+
+    ds = test4.full("param", "levelist")
+    assert not np.isnan(ds.to_numpy()).any()
+
+
+def test_grib_metadata_sidecar(monkeypatch):
+    from climetlab.core.table import MetadataTable
+
+    with temp_directory() as tmpdir:
+        path = os.path.join(tmpdir, "test4.grib")
+        shutil.copyfile(climetlab_file("docs/examples/test4.grib"), path)
+
+        ds = load_source("file", path)
+        assert len(ds.sel(param="t")) == 2
+
+        # Only the keys used are stored
+        columns = read_metadata_sidecar(metadata_sidecar_path(path), 4)
+        assert set(columns) == {"param"}
+        codes, values = columns["param"]
+        assert [values[i] for i in codes] == ["t", "z", "t", "z"]
+
+        assert ds.order_by(level="descending")[0].metadata("levelist") == 850
+        assert ds.to_datetime_list() == [datetime.datetime(2007, 1, 1, 12)]
+        columns = read_metadata_sidecar(metadata_sidecar_path(path), 4)
+        assert set(columns) == {"param", "levelist", "valid_datetime"}
+
+        # Another session does not read the metadata of the fields
+        with monkeypatch.context() as m:
+            m.setattr(MetadataTable, "from_elements", None)
+            ds = load_source("file", path)
+            assert ds.unique_values("param", "levelist") == dict(
+                param=("t", "z"), levelist=(500, 850)
+            )
+            ds = ds.sel(param="t").order_by(level="descending")
+            assert [f.offset for f in ds] == [2 * 130428, 0]
+            assert ds.to_datetime_list() == [datetime.datetime(2007, 1, 1, 12)]
+
+        # New keys are added to the sidecar
+        ds = load_source("file", path)
+        assert ds.unique_values("gridType") == dict(gridType=("regular_ll",))
+        columns = read_metadata_sidecar(metadata_sidecar_path(path), 4)
+        assert set(columns) == {"param", "levelist", "valid_datetime", "gridType"}
+
+
+def test_grib_headers_only():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    f = s[2]
+
+    assert f.metadata("param") == "t"
+    assert f.metadata("level") == 850
+    assert f.shape == (181, 360)
+    assert f.as_mars()["levelist"] == 850
+    assert f._handle is None and f._header is not None
+
+    # The full message is only read to access the data
+    assert f.to_numpy().shape == (181, 360)
+    assert f._handle is not None and f._header is None
+    assert f.metadata("param") == "t"
+
+    f = s[1]
+    assert f["values"].shape == (181 * 360,)
+    assert f._handle is not None
+
+    assert len(s.sel(param="t")) == 2
+
+
+def test_grib_headers_without_lock():
+    import threading
+
+    from climetlab.readers.grib.codes import CodesReader
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    fields = list(s)
+
+    # The headers are read while another thread holds the lock of the file
+    result = []
+    with CodesReader.from_cache(s.path).lock:
+        thread = threading.Thread(
+            target=lambda: result.extend(f.metadata("param") for f in fields)
+        )
+        thread.start()
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+
+    assert result == ["t", "z", "t", "z"]
+
+
+@pytest.mark.parametrize("numpy_decoder", [False, True])
+def test_grib_headers_bytes_read(monkeypatch, numpy_decoder):
+    from climetlab.readers.grib.codes import CodesReader
+
+    read = []
+    read_bytes = CodesReader.read_bytes
+
+    def counting(self, offset, length):
+        read.append(length)
+        return read_bytes(self, offset, length)
+
+    monkeypatch.setattr(CodesReader, "read_bytes", counting)
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    f = s[0]
+    length = f._length
+
+    # Only the headers are read to access the metadata
+    assert f.metadata("param") == "t"
+    assert f.shape == (181, 360)
+    assert f.to_bounding_box().north == 90
+    header = sum(read)
+    assert header < 200
+
+    # The message is then read once, at most
+    with SETTINGS.temporary("use-numpy-grib-decoder", numpy_decoder):
+        values = f.to_numpy()
+    assert values.shape == (181, 360)
+    assert sum(read) <= header + length
+    # The NumPy decoder only reads the data section, without an eccodes handle
+    assert (f._handle is None) == numpy_decoder
+    assert (values == load_source("file", s.path)[0].to_numpy()).all()
+
+
+def test_grib_headers_reused_as_handle():
+    from climetlab.readers.grib.codes import GribField
+
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    size = s[0]._length
+
+    with SETTINGS.temporary("maximum-grib-fields-memory", str(size * 10)):
+        # Without its length, the whole message is read to access the headers,
+        # and the same handle is used for the data
+        f = GribField(s.path, 0, None)
+        header = f.header
+        assert f.handle is header
+        assert f._header is None
+        assert f.metadata("param") == "t"
+
+        # The header is known by its length, its memory is not counted twice
+        f = GribField(s.path, 0, size)
+        f.header
+        entry = f._memory["_header"]
+        assert entry in MEMORY.entries
+        f.handle
+        assert entry not in MEMORY.entries
+        assert f._memory["_handle"] in MEMORY.entries
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 
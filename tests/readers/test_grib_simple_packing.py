@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# (C) Copyright 2023 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import os
+
+import eccodes
+import numpy as np
+import pytest
+
+from climetlab import load_source
+from climetlab.core.settings import SETTINGS
+from climetlab.core.temporary import temp_directory
+from climetlab.readers.grib.codes import GribField
+from climetlab.readers.grib.simple import decode_simple_packing, unpack_bits
+from climetlab.testing import climetlab_file
+
+
+def _encode(path, edition, bitmap, bits_per_value, decimal_scale_factor):
+    with open(climetlab_file("docs/examples/test4.grib"), "rb") as f:
+        h = eccodes.codes_new_from_file(f, eccodes.CODES_PRODUCT_GRIB)
+    try:
+        if edition == 2:
+            eccodes.codes_set_long(h, "edition", 2)
+        values = eccodes.codes_get_values(h)
+        values *= np.linspace(1, 1.01, len(values))
+        if bitmap:
+            eccodes.codes_set_long(h, "bitmapPresent", 1)
+            values[::7] = eccodes.codes_get_double(h, "missingValue")
+        eccodes.codes_set_long(h, "decimalScaleFactor", decimal_scale_factor)
+        eccodes.codes_set_long(h, "bitsPerValue", bits_per_value)
+        eccodes.codes_set_values(h, values)
+        with open(path, "wb") as f:
+            eccodes.codes_write(h, f)
+        return eccodes.codes_get_values(h)
+    finally:
+        eccodes.codes_release(h)
+
+
+@pytest.mark.parametrize("bits_per_value", list(range(1, 33)) + [40, 48, 57])
+def test_unpack_bits(bits_per_value):
+    count = 123
+    rng = np.random.default_rng(bits_per_value)
+    expected = rng.integers(0, 1 << bits_per_value, count, dtype=np.uint64)
+
+    bits = "".join(format(int(x), f"0{bits_per_value}b") for x in expected)
+    bits += "0" * (-len(bits) % 8)
+    data = int(bits, 2).to_bytes(len(bits) // 8, "big")
+
+    assert (unpack_bits(data, bits_per_value, count) == expected).all()
+
+
+@pytest.mark.parametrize("edition", [1, 2])
+@pytest.mark.parametrize("bitmap", [False, True])
+@pytest.mark.parametrize("decimal_scale_factor", [0, 2])
+def test_decode_simple_packing(edition, bitmap, decimal_scale_factor):
+    with temp_directory() as tmp:
+        for bits_per_value in list(range(0, 33)) + [40, 48]:
+            path = os.path.join(tmp, f"{bits_per_value}.grib")
+            expected = _encode(
+                path, edition, bitmap, bits_per_value, decimal_scale_factor
+            )
+
+            field = GribField(path, 0, os.path.getsize(path))
+            values = decode_simple_packing(field)
+            assert values is not None, bits_per_value
+            assert values.tobytes() == expected.tobytes(), bits_per_value
+
+            values = decode_simple_packing(field, np.float32)
+            assert values.dtype == np.float32
+            assert (values == expected.astype(np.float32)).all(), bits_per_value
+
+
+def test_decode_simple_packing_fallback():
+    with temp_directory() as tmp:
+        path = os.path.join(tmp, "complex.grib")
+        with open(climetlab_file("docs/examples/test4.grib"), "rb") as f:
+            h = eccodes.codes_new_from_file(f, eccodes.CODES_PRODUCT_GRIB)
+        eccodes.codes_set_long(h, "edition", 2)
+        eccodes.codes_set_string(h, "packingType", "grid_ieee")
+        with open(path, "wb") as f:
+            eccodes.codes_write(h, f)
+        expected = eccodes.codes_get_values(h)
+        eccodes.codes_release(h)
+
+        field = GribField(path, 0, os.path.getsize(path))
+        assert decode_simple_packing(field) is None
+
+        with SETTINGS.temporary("use-numpy-grib-decoder", True):
+            assert (field.to_numpy(reshape=False) == expected).all()
+
+
+def test_numpy_grib_decoder_setting():
+    s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    expected = s.to_numpy()
+
+    with SETTINGS.temporary("use-numpy-grib-decoder", True):
+        s = load_source("file", climetlab_file("docs/examples/test4.grib"))
+        assert s.to_numpy().tobytes() == expected.tobytes()
+        assert (s.to_numpy(dtype=np.float32) == expected.astype(np.float32)).all()
+
+        # The data section is decoded without creating an eccodes handle
+        f = s[0]
+        assert f.to_numpy().tobytes() == expected[0].tobytes()
+        assert f._handle is None
+
+
+if __name__ == "__main__":
+    from climetlab.testing import main
+
+    main(__file__)
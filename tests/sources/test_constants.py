@@ -49,6 +49,20 @@ def test_constant():
     assert len(ds) == len(params) * len(dates)
 
 
+def test_constant_selection():
+    sample = load_source("file", climetlab_file("docs/examples/test.grib"))
+
+    ds = load_source(
+        "constants",
+        sample,
+        date=sample[0].datetime(),
+        param=["cos_latitude", "sin_latitude"],
+    )
+
+    assert len(ds.sel(param="cos_latitude")) == 1
+    assert ds.unique_values("param") == {"param": ("cos_latitude", "sin_latitude")}
+
+
 if __name__ == "__main__":
     from climetlab.testing import main
 
@@ -177,6 +177,34 @@ def test_multi_grib_mixed():
     assert len(ds) == 2
 
 
+@pytest.mark.parametrize("threads", [1, 4])
+def test_multi_getitem(threads):
+    from climetlab.core.settings import SETTINGS
+    from climetlab.sources.multi import MultiSource
+    from climetlab.testing import climetlab_file
+
+    test4 = load_source("file", climetlab_file("docs/examples/test4.grib"))
+    parts = [
+        test4.sel(param="z"),
+        test4.sel(param="q"),  # Empty
+        test4,
+        test4.sel(param="q"),
+        test4[3:],
+    ]
+    expected = [f.offset for p in parts for f in p]
+    assert len(expected) == 7
+
+    with SETTINGS.temporary("number-of-length-threads", threads):
+        for ds in (MultiSource(parts), load_source("multi", *parts)):
+            assert len(ds) == 7
+            for n in (6, 0, 3, 2, 5, 1, 4):
+                assert ds[n].offset == expected[n]
+            assert ds[-1].offset == expected[-1]
+            assert [f.offset for f in ds] == expected
+            with pytest.raises(IndexError):
+                ds[7]
+
+
 @pytest.mark.download
 def test_download_tar():
     ds = load_source(